@@ -25,8 +25,10 @@
 
 from socket import socket, AF_INET, SOCK_DGRAM, timeout
 from snippets import load_json_data, dump_json_data
+from timeit import default_timer
 
 BUFFER_LIMIT = 20000
+SUBSCRIPTION_LEASE = 60  # Time (in seconds) after which a subscription expires, unless it is renewed.
 
 
 class GridAPI:
@@ -53,6 +55,7 @@ class GridAPI:
         #     grid_module_ip, grid_module_port
         self.grid_module_ip = grid_module_ip
         self.grid_module_port = grid_module_port
+        self._states = {}  # Last known state, for every set of fields.
 
     def ready(self):
         """Make sure that the GrdiAPI has been initialized.
@@ -82,18 +85,23 @@ class GridAPI:
         assert {'S', 'V'} <= base_quantities.keys()
         self._base_quantities = base_quantities
 
-    def get_state(self, timeout_s=None):
+    def get_state(self, timeout_s=None, fields=None):
         """Communicate with the grid module to retrieve the grid's state.
 
         If a timeout is specified and is exceeded, the GridAPI will attempt to
-        return the previously known state.  If no state was known from history,
-        then the timeout exception is simply re-raised.
+        return the previously known state with the same fields.  If no such
+        state was known from history, then the timeout exception is simply
+        re-raised.
 
         Parameters
         ----------
             timeout_s : float (optional, default None)
                 Timeout in seconds for the UDP communication.
 
+            fields : list of str (optional, default None)
+                Fields of the state to retrieve, e.g., ['Vm', 'Va'].  By
+                default, all the fields published by the grid module.
+
         Returns
         -------
             state : dict
@@ -104,10 +112,16 @@ class GridAPI:
             timeout : socket.timeout
                 Operation timed out and no state was known from history.
 
+            error : ValueError
+                Some fields are not published by the grid module.
+
         """
+        key = None if fields is None else tuple(fields)
         sock = socket(AF_INET, SOCK_DGRAM)
         sock.settimeout(timeout_s)
         message = {'type': 'request'}
+        if fields is not None:
+            message['fields'] = list(fields)
         data = dump_json_data(message)
 
         try:
@@ -116,15 +130,104 @@ class GridAPI:
         except timeout as e:
             try:
                 # Try to return the previous state in the case of a timeout.
-                return self._state
-            except AttributeError:
+                return self._states[key]
+            except KeyError:
                 # If impossible, re-raise the timeout exception.
                 raise e
 
-        self._state = load_json_data(reply)
-        return self._state
+        state = load_json_data(reply)
+        if 'error' in state:
+            raise ValueError(state['error'])
+        self._states[key] = state
+        return state
+
+    def subscribe(self, fields=None, lease_s=SUBSCRIPTION_LEASE):
+        """Subscribe to the states published by the grid module.
+
+        Parameters
+        ----------
+            fields : list of str (optional, default None)
+                Fields of the state to receive, e.g., ['Vm', 'Va'].  By
+                default, all the fields published by the grid module.
+
+            lease_s : float (optional, default SUBSCRIPTION_LEASE)
+                Time in seconds after which the grid module stops pushing the
+                states, unless the subscription is renewed.
+
+        Returns
+        -------
+            subscription : Subscription
+                Subscription from which to get the states.
+
+        """
+        return Subscription((self.grid_module_ip, self.grid_module_port), fields, lease_s)
+
+    def get_metrics(self, count=None, timeout_s=None):
+        """Retrieve the metrics of the last load flows from the grid module.
+
+        Parameters
+        ----------
+            count : int (optional, default None)
+                Number of load flows.  By default, the grid module decides.
+
+            timeout_s : float (optional, default None)
+                Timeout in seconds for the UDP communication.
+
+        Returns
+        -------
+            solves : list of dict
+                Metrics of every load flow, the last one at the end: version
+                of the solution, algorithm, whether the LF was incremental or
+                approximated, iterations, residual, whether it converged, and
+                time (in seconds) spent in assembly, iteration and
+                post-processing.
+
+        Raises
+        ------
+            timeout : socket.timeout
+                Operation timed out.
+
+        """
+        sock = socket(AF_INET, SOCK_DGRAM)
+        sock.settimeout(timeout_s)
+        message = {'type': 'metrics'}
+        if count is not None:
+            message['count'] = count
+        sock.sendto(dump_json_data(message), (self.grid_module_ip, self.grid_module_port))
+        reply, _ = sock.recvfrom(BUFFER_LIMIT)
+
+        return load_json_data(reply)['solves']
+
+    def get_latency(self, timeout_s=None):
+        """Retrieve the time that the grid module spends handling the messages.
 
-    def implement_setpoint(self, bus_index, P, Q):
+        Parameters
+        ----------
+            timeout_s : float (optional, default None)
+                Timeout in seconds for the UDP communication.
+
+        Returns
+        -------
+            latency : dict
+                For every type of message, the number of handled messages,
+                and the mean ('mean'), median ('p50'), 99th percentile
+                ('p99') and largest ('max') handling time (in seconds) of the
+                last ones.
+
+        Raises
+        ------
+            timeout : socket.timeout
+                Operation timed out.
+
+        """
+        sock = socket(AF_INET, SOCK_DGRAM)
+        sock.settimeout(timeout_s)
+        sock.sendto(dump_json_data({'type': 'latency'}), (self.grid_module_ip, self.grid_module_port))
+        reply, _ = sock.recvfrom(BUFFER_LIMIT)
+
+        return load_json_data(reply)['latency']
+
+    def implement_setpoint(self, bus_index, P, Q, phase=None):
         """Implement a new setpoint.
 
         Parameters
@@ -138,6 +241,10 @@ class GridAPI:
             Q : float
                 New value for the reactive (Q, in Var) power.
 
+            phase : {1, 2, 3} (optional, default None)
+                Phase to which the setpoint applies in a three-phase grid.
+                By default, the setpoint is split equally between the phases.
+
         """
 
         sock = socket(AF_INET, SOCK_DGRAM)
@@ -147,5 +254,103 @@ class GridAPI:
             'P': P,
             'Q': Q
         }
+        if phase is not None:
+            message['phase'] = phase
         data = dump_json_data(message)
         sock.sendto(data, (self.grid_module_ip, self.grid_module_port))
+
+    def switch_line(self, line, closed):
+        """Open or close a line of the grid.
+
+        Parameters
+        ----------
+            line : int
+                Index of the line.
+
+            closed : bool
+                Whether to close (True) or to open (False) the line.
+
+        """
+        sock = socket(AF_INET, SOCK_DGRAM)
+        message = {
+            'type': 'switch_line',
+            'line': line,
+            'closed': closed
+        }
+        data = dump_json_data(message)
+        sock.sendto(data, (self.grid_module_ip, self.grid_module_port))
+
+
+class Subscription:
+    """Subscription to the states published by the grid module.
+
+    The grid module pushes every new state to the socket of the subscription,
+    starting with the current state, from the first retrieval on.  The
+    subscription is renewed whenever a state is retrieved after half of its
+    lease, or until a state is received, in case the subscription was lost.
+
+    """
+    def __init__(self, grid_module_addr, fields=None, lease_s=SUBSCRIPTION_LEASE):
+        self.grid_module_addr = grid_module_addr
+        self.lease_s = lease_s
+        self._message = {'type': 'subscribe', 'lease': lease_s}
+        if fields is not None:
+            self._message['fields'] = list(fields)
+        self._sock = socket(AF_INET, SOCK_DGRAM)
+        self._received = False
+
+    def _renew(self):
+        self._sock.sendto(dump_json_data(self._message), self.grid_module_addr)
+        self._renewal_time = default_timer()
+
+    def get(self, timeout_s=None):
+        """Wait for a new state.
+
+        If several states were pushed since the last call, only the last one
+        is returned.
+
+        Parameters
+        ----------
+            timeout_s : float (optional, default None)
+                Timeout in seconds to wait for a new state.  It should be
+                shorter than half of the lease, so that the subscription is
+                renewed even if no new state is pushed.
+
+        Returns
+        -------
+            state : dict
+                State of the grid.
+
+        Raises
+        ------
+            timeout : socket.timeout
+                No new state was pushed in time.
+
+            error : ValueError
+                Some fields are not published by the grid module.
+
+        """
+        if not self._received or default_timer() - self._renewal_time > self.lease_s / 2:
+            self._renew()
+
+        self._sock.settimeout(timeout_s)
+        reply, _ = self._sock.recvfrom(BUFFER_LIMIT)
+
+        # Skip to the last pushed state.
+        self._sock.setblocking(False)
+        try:
+            while True:
+                reply, _ = self._sock.recvfrom(BUFFER_LIMIT)
+        except BlockingIOError:
+            pass
+
+        state = load_json_data(reply)
+        if 'error' in state:
+            raise ValueError(state['error'])
+        self._received = True
+        return state
+
+    def close(self):
+        """Unsubscribe from the states."""
+        self._sock.sendto(dump_json_data({'type': 'unsubscribe'}), self.grid_module_addr)
+        self._sock.close()
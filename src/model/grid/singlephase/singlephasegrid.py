@@ -23,14 +23,207 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from numpy import delete, zeros, ones, dot, append, subtract, insert, add, array, put, full, vstack, divide, diag, inf, conjugate
+from numpy import delete, zeros, dot, append, array, put, full, vstack, inf, conjugate, concatenate, \
+    add, bincount, split, flatnonzero, diff, absolute, angle, exp, asarray, broadcast_to, unique, ones, eye, \
+    atleast_1d, ix_, union1d, setdiff1d, median, isfinite
+from numpy.random import default_rng
+from numpy import load, save
 from numpy.linalg import inv, solve, norm
+from collections import deque
+from hashlib import sha256
+from json import dumps
 from operator import itemgetter
-from scipy.linalg import lu
+from os import path, makedirs, rename, listdir
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer as timer
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse import coo_matrix, csr_matrix, diags, bmat
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu, spsolve
+
+
+# Algorithms that keep the admittance matrix in a sparse format.
+SPARSE_ALGORITHMS = ('SCW', 'NR', 'BFS', 'FDLF')
+
+# Maximum number of buses whose change is estimated from cached sensitivity
+# coefficients.  Larger changes are estimated with one solve of the factorized
+# Jacobian instead.
+SENSITIVITY_BUSES = 10
+
+# Largest change of the voltages (infinity norm, in p.u.) of the operating
+# point before the Jacobian used for the sensitivities is refactorized.
+SENSITIVITY_DRIFT = 1e-2
+
+# Version of the layout of the compiled-grid cache, to be increased whenever
+# the cached arrays change.
+CACHE_VERSION = 2
+
+# Largest number of buses at the ends of the open lines for which the
+# factors of the closed grid are kept and corrected with a low-rank update.
+# Beyond that, Yll is refactorized after switching a line.
+REFACTORIZATION_BUSES = 50
+
+# Number of load flows kept in the solve history.
+SOLVE_HISTORY = 1000
+
+# Default maximum number of iterations of a load flow, and number of
+# consecutive increases of the residual after which a load flow is stopped
+# as divergent (as is a residual that is not finite).
+MAX_ITER = 1000
+DIVERGENCE_ITERATIONS = 10
+
+# Default tolerance (p.u.) on the voltage update, and noise floor of the
+# voltage update, relative to the largest voltage, below which a load flow
+# whose update stops decreasing has converged as far as floating-point
+# arithmetic allows.
+VOLTAGE_TOLERANCE = 1e-10
+NOISE_FLOOR = 1e-12
+
+# Calibration of ALG = 'auto': number of timed operating points, largest grid
+# for the dense CW algorithm, limit of iterations, and voltage drop (p.u.) of
+# the operating points.
+AUTO_SAMPLES = 3
+AUTO_DENSE_BUSES = 500
+AUTO_MAX_ITER = 200
+AUTO_VOLTAGE_DROP = 0.05
+
+
+def load_arrays(directory):
+    # Memory-map the arrays of a directory of .npy files, or return None if
+    # the directory does not exist.
+    if not path.isdir(directory):
+        return None
+    return {name[:-len('.npy')]: load(path.join(directory, name), mmap_mode = 'r')
+            for name in listdir(directory) if name.endswith('.npy')}
+
+
+def store_arrays(directory, arrays):
+    # Write arrays to a directory of .npy files.  The files are written to a
+    # temporary directory that is then renamed, so that concurrent readers
+    # never see a partial directory.
+    parent = path.dirname(directory)
+    makedirs(parent, exist_ok = True)
+    temporary = mkdtemp(dir = parent)
+    try:
+        for name, values in arrays.items():
+            save(path.join(temporary, name + '.npy'), values)
+        rename(temporary, directory)
+    except OSError:
+        # Another process stored the same arrays first.
+        rmtree(temporary, ignore_errors = True)
+
+
+def calibrate(data, samples = AUTO_SAMPLES, seed = 0, **kwargs):
+    """Select the fastest load-flow algorithm for a grid.
+
+    Every available algorithm (CW for small grids only, SCW, NR, BFS for
+    radial grids only, and FDLF) solves the same random operating points,
+    whose uniform load is scaled so that the largest voltage drop is about
+    AUTO_VOLTAGE_DROP.  The first operating point warms the solvers up, and
+    the others are timed.  An algorithm is dropped at the first operating
+    point where it does not converge.
+
+    Parameters
+    ----------
+        data : dict
+            Grid configuration, as for `SinglePhaseGrid`.
+
+        samples : int (optional, default AUTO_SAMPLES)
+            Number of timed operating points.
+
+        seed : int (optional, default 0)
+            Seed of the random operating points.
+
+        kwargs
+            Other arguments of `SinglePhaseGrid` (tolerance, max_iter and
+            cache_path).
+
+    Returns
+    -------
+        algorithm : str
+            Algorithm with the lowest median time among those that converged
+            at every operating point, or among all of them if none did.
+
+        calibration : dict
+            Median time (in seconds) of a load flow, over the operating points
+            it solved, and whether it always converged, for every algorithm.
+
+    """
+    kwargs['max_iter'] = min(kwargs.get('max_iter') or AUTO_MAX_ITER, AUTO_MAX_ITER)
+    reference = SinglePhaseGrid(data, ALG = 'SCW', **kwargs)
+    n = reference.no_buses
+
+    # Scale the load with the voltage drop of a light load, in the linear
+    # regime.
+    puLoad = 1e-3 / (n - 1)
+    reference.update([- puLoad * reference.baseS] * (n - 1), [0] * (n - 1), reference.baseV, 0)
+    drop = 1 - absolute(reference.realV + 1j * reference.imagV).min() / reference.baseV
+    if drop > 0:
+        puLoad *= AUTO_VOLTAGE_DROP / drop
+
+    rng = default_rng(seed)
+    points = []
+    for _ in range(samples + 1):
+        P = - puLoad * reference.baseS * rng.uniform(0.5, 1.5, n - 1)
+        points.append((P.tolist(), (0.3 * P).tolist()))
+
+    candidates = (['CW'] if n <= AUTO_DENSE_BUSES else []) + ['SCW', 'NR'] + \
+        (['BFS'] if reference.radial else []) + ['FDLF']
+    calibration = {}
+    for algorithm in candidates:
+        grid = reference if algorithm == 'SCW' else SinglePhaseGrid(data, ALG = algorithm, **kwargs)
+        times = []
+        for P, Q in points:
+            start = timer()
+            grid.update(P, Q, grid.baseV, 0)
+            times.append(timer() - start)
+            if not grid.converged:
+                # Do not spend max_iter iterations on every operating point.
+                break
+        calibration[algorithm] = {'time': float(median(times[1:] or times)), 'converged': grid.converged}
+
+    converging = [algorithm for algorithm in candidates if calibration[algorithm]['converged']] or candidates
+    return min(converging, key = lambda algorithm: calibration[algorithm]['time']), calibration
 
 
 class SinglePhaseGrid:
-    def __init__(self, data, ALG = 'CW', voltage_tolerance = 1e-15, api_path = None):
+    # ALG selects the load-flow algorithm:
+    #   'CW'  - Z-bus (fixed-point) iteration on the dense LU factors of Yll,
+    #   'SCW' - same iteration on the sparse LU factors of Yll (large grids),
+    #   'NR'  - Newton-Raphson in rectangular coordinates, with a sparse
+    #           Jacobian,
+    #   'BFS' - backward/forward sweep, for radial grids only,
+    #   'FDLF' - fast-decoupled load flow (XB scheme) with constant B' and
+    #           B'' that are factorized once,
+    #   'auto' - the fastest of the above on this grid, selected by a short
+    #           calibration (see calibrate) that is stored in calibration.
+    # The iterations stop once the infinity norm of the voltage update drops
+    # below voltage_tolerance ('absolute' mode) or below voltage_tolerance
+    # times the infinity norm of the voltages ('relative' mode), or once it
+    # stops decreasing below NOISE_FLOOR times the infinity norm of the
+    # voltages, or after max_iter iterations (None means no limit), or as
+    # soon as the solver diverges, i.e., its residual is not finite or
+    # increased at the last DIVERGENCE_ITERATIONS iterations.  With
+    # warm_start, each load flow starts from the previous solution instead of
+    # the no-load voltage.
+    # With approximate, update first estimates the voltages by linearizing
+    # the load flow around the last exact solution, and only runs the solver
+    # if the power mismatch of the estimate exceeds approximation_tolerance
+    # (infinity norm, in p.u.).  With cache_path, the compiled grid (Ybus,
+    # topology and dense factors) is stored in that directory, keyed by a hash
+    # of the lines and base quantities, and memory-mapped by later instances
+    # of the same grid instead of being recomputed.  Lines can be opened and
+    # closed at runtime with switch_line.
+    def __init__(self, data, ALG = 'CW', voltage_tolerance = VOLTAGE_TOLERANCE, api_path = None,
+                 tolerance_mode = 'absolute', max_iter = MAX_ITER, warm_start = True,
+                 approximate = False, approximation_tolerance = 1e-6, cache_path = None):
+        self.calibration = None
+        if ALG == 'auto':
+            ALG, self.calibration = calibrate(data, voltage_tolerance = voltage_tolerance,
+                                              tolerance_mode = tolerance_mode, max_iter = max_iter,
+                                              cache_path = cache_path)
+
         self.lines = tuple((line['from'], line['to'], line['R'], line['X'], line['B'], ) for line in data['lines'])
         self.no_lines = len(self.lines)
         self.no_buses = max(self.lines, key = itemgetter(1))[1] + 1 # +1 because the bus indices start from 0
@@ -40,17 +233,116 @@ class SinglePhaseGrid:
         self.Ybase = self.baseS / (self.baseV * self.baseV)
 
         self.tolerance = voltage_tolerance
+        if tolerance_mode not in ('absolute', 'relative'):
+            raise ValueError("Unknown tolerance mode: {}".format(tolerance_mode))
+        self.tolerance_mode = tolerance_mode
+        self.max_iter = max_iter
+        self.warm_start = warm_start
+
+        self.approximate = approximate
+        self.approximation_tolerance = approximation_tolerance
+        self.__linearization = None
+        self.__dirty = set()
+
+        # Outcome of the last load flow.
+        self.iterations = 0
+        self.residual = inf
+        self.converged = False
+        self.approximated = False
+
+        # Quantities derived from the solution (slack power and currents),
+        # computed on first access and kept until the next solution, whose
+        # version is incremented.
+        self.version = 0
+        self.__derived = {}
+
+        # Outcome and timings (in seconds) of the last SOLVE_HISTORY load
+        # flows, the last one at the end: time spent assembling the problem
+        # (injections, initial voltages and estimates), iterating, and post-
+        # processing the solution (including the derived quantities).
+        self.solves = deque(maxlen = SOLVE_HISTORY)
+        self.__solveStart = self.__iterationStart = self.__solveEnd = 0
+
+        if cache_path is not None:
+            topology = {'lines': data['lines'], 'base_quantities': data['base_quantities'], 'version': CACHE_VERSION}
+            cache_path = path.join(cache_path, sha256(dumps(topology, sort_keys = True).encode()).hexdigest())
 
         #Compute the admittance matrix.
-        self.__admittance_matrix()
+        cached = load_arrays(path.join(cache_path, 'grid')) if cache_path is not None else None
+        if cached is None:
+            self.__admittance_matrix()
+            self.__radial_structure()
+            if cache_path is not None:
+                store_arrays(path.join(cache_path, 'grid'), self.__compiledGrid())
+        else:
+            self.__loadCompiledGrid(cached)
 
-        self.siY = self.__puY * self.Ybase
         self.algorithm = ALG
+        self.__puYl0 = self.__puY[1:, [0]].toarray()
+        self.__puYllLU = None
+        self.__puYsparse = self.__puY
+        self.__puYslack = self.__puYsparse[[0]]
+
+        # Series and shunt admittances (in SI) of the lines, for the currents.
+        self.__siYline = self.__puYline * self.Ybase
+        self.__siBline = self.__puBline * self.Ybase
+
+        # Admittance matrix and factors of the grid with all lines closed,
+        # and the lines that are currently open.
+        self.__puYbase = self.__puY
+        self.__puYl0base = self.__puYl0
+        self.__openLines = array([], dtype = int)
+        self.__switchedSolveYll = None
 
         if self.algorithm == 'CW':
-            self.__puYll = delete(delete(self.__puY, 0, 0), 0, 1)
-            self.__puP, self.__puL, self.__puU = lu(self.__puYll)
-            self.__puYllInv = inv(self.__puYll)
+            # The dense matrices are the most expensive part to compile.
+            cached = load_arrays(path.join(cache_path, 'CW')) if cache_path is not None else None
+            if cached is None:
+                self.__puY = self.__puY.toarray()
+                self.siY = self.__puY * self.Ybase
+                puYll = delete(delete(self.__puY, 0, 0), 0, 1)
+                # Packed LU factors with the row pivots, since Yll of a
+                # meshed grid is not factorized without pivoting.
+                self.__puYllLUpiv = lu_factor(puYll)
+                self.__puYllInv = inv(puYll)
+                if cache_path is not None:
+                    store_arrays(path.join(cache_path, 'CW'),
+                                 {'Y': self.__puY, 'siY': self.siY, 'LU': self.__puYllLUpiv[0],
+                                  'piv': self.__puYllLUpiv[1], 'YllInv': self.__puYllInv})
+            else:
+                self.__puY = cached['Y']
+                self.siY = cached['siY']
+                # SciPy crashes on read-only pivots, which are small.
+                self.__puYllLUpiv = (cached['LU'], array(cached['piv']))
+                self.__puYllInv = cached['YllInv']
+        else:
+            if self.algorithm not in SPARSE_ALGORITHMS:
+                self.__puY = self.__puY.toarray()
+            self.siY = self.__puY * self.Ybase
+
+        if self.algorithm == 'SCW':
+            # Sparse CW: Yll is factorized once and never inverted.  SciPy
+            # cannot store sparse LU factors, which are cheap to recompute.
+            self.__puYllLU = splu(self.__puY[1:, 1:].tocsc())
+
+        elif self.algorithm == 'BFS':
+            if not self.radial:
+                raise ValueError("The backward/forward sweep requires a radial grid")
+            # Impedance of the line towards the parent of every bus.
+            self.__puZparent = zeros(self.no_buses, dtype = complex)
+            self.__puZparent[1:] = 1 / self.__puYline[self.__parentLine[1:]]
+
+        elif self.algorithm == 'FDLF':
+            # B' only accounts for the line reactances, and B'' is the
+            # negated susceptance of Yll (shunts included).
+            puX = (1 / self.__puYline).imag
+            self.__puBpLU = splu(self.__laplacian(1 / puX)[1:, 1:].tocsc())
+            self.__puBppLU = splu(- self.__puY[1:, 1:].imag.tocsc())
+
+        if self.algorithm == 'SCW':
+            self.__puWunit = - self.__puYllLU.solve(self.__puYl0)
+        elif self.algorithm == 'CW':
+            self.__puWunit = - dot(self.__puYllInv, self.__puYl0)
 
         if api_path is not None:
             from snippets import load_api, dump_api
@@ -60,156 +352,939 @@ class SinglePhaseGrid:
 
 
     def __admittance_matrix(self):
-        A = zeros((self.no_buses, self.no_lines), dtype = complex)
-        for i in range(self.no_lines):
-            A[self.lines[i][0], i] = 1
-            A[self.lines[i][1], i] = -1
+        # Assemble Y = A diag(L) A.T + diag(|A| B) directly in a sparse format,
+        # where A is the bus-line incidence matrix.
+        self.__lineFrom = array([line[0] for line in self.lines])
+        self.__lineTo = array([line[1] for line in self.lines])
 
-        L = zeros((self.no_lines), dtype = complex)
-        for i in range(self.no_lines):
-            L[i] = 1 / (complex(self.lines[i][2], self.lines[i][3]) * self.Ybase)
+        L = 1 / ((array([line[2] for line in self.lines]) + 1j * array([line[3] for line in self.lines])) * self.Ybase)
+        B = 1j * array([line[4] for line in self.lines]) / self.Ybase / 2
+        self.__puYline = L
+        self.__puBline = B
 
-        B = zeros((self.no_lines, 1), dtype = complex)
-        for i in range(self.no_lines):
-            B[i, 0] = complex(0, self.lines[i][4] / self.Ybase / 2)
+        # Shunt admittance of every bus.
+        self.__puYshunt = 1j * (bincount(self.__lineFrom, B.imag, self.no_buses) +
+                                bincount(self.__lineTo, B.imag, self.no_buses))
 
-        self.__puY = add(dot(A, dot(diag(L), A.T)), diag(dot(abs(A), B).flatten()))
+        self.__puY = (self.__laplacian(L) + diags(self.__puYshunt)).tocsr()
 
 
-    def __Jacob(self, VrVi0):
-        u = self.no_buses - 1 # u is the number of PQ buses
-        J = zeros((2 * u, 2 * u))
-
-        for i in range(1, self.no_buses):
-            for j in range(1, self.no_buses):
-                if i != j:
-                    J[i - 1, j - 1] = self.__puY[i, j].real * VrVi0[i] + self.__puY[i, j].imag * VrVi0[self.no_buses + i]
-                    J[i - 1, j - 1 + u] = -self.__puY[i, j].imag * VrVi0[i] + self.__puY[i, j].real * VrVi0[self.no_buses + i]
-                    J[i - 1 + u, j - 1] = J[i - 1, j - 1 + u]
-                    J[i - 1 + u, j - 1 + u] = - J[i - 1, j - 1]
-                else:
-                    sumPR = sumPX = sumQR = sumQX = 0
-                    for k in range(self.no_buses):
-                        if k != i:
-                            a = self.__puY[i, k].real * VrVi0[k] - self.__puY[i, k].imag * VrVi0[self.no_buses + k]
-                            b = self.__puY[i, k].imag * VrVi0[k] + self.__puY[i, k].real * VrVi0[self.no_buses + k]
-                            sumPR += a
-                            sumPX += b
-                            sumQR -= b
-                            sumQX += a
-                    J[i - 1, j - 1] = sumPR + 2 * self.__puY[i, j].real * VrVi0[i]
-                    J[i - 1, j - 1 + u] = sumPX + 2 * self.__puY[i, j].real * VrVi0[i + self.no_buses]
-                    J[i - 1 + u, j - 1] = sumQR - 2 * self.__puY[i, j].imag * VrVi0[i]
-                    J[i - 1 + u, j - 1 + u] = sumQX - 2 * self.__puY[i, j].imag * VrVi0[i + self.no_buses]
-
-        return J
-
-
-    def __calculPQ(self, VrVi0):
-        PQ0 = zeros(2 * (self.no_buses - 1))
-
-        for i in range (1, self.no_buses):
-            sum1 = sum2 = sum3 = sum4 = 0
-            for k in range (self.no_buses):
-                a = self.__puY[i, k].real * VrVi0[k] - self.__puY[i, k].imag * VrVi0[k + self.no_buses]
-                b = self.__puY[i, k].imag * VrVi0[k] + self.__puY[i, k].real * VrVi0[k + self.no_buses]
-                sum1 += a
-                sum2 += b
-                sum3 += b
-                sum4 += a
-            PQ0[i - 1] = sum1 * VrVi0[i] + sum2 * VrVi0[i + self.no_buses]
-            PQ0[i - 1 + self.no_buses - 1] = -sum3 * VrVi0[i] + sum4 * VrVi0[i + self.no_buses]
-
-        return PQ0
+    def __compiledGrid(self):
+        # Arrays of the admittance matrix and the topology, for the cache.
+        return {
+            'lineFrom': self.__lineFrom, 'lineTo': self.__lineTo,
+            'Yline': self.__puYline, 'Bline': self.__puBline, 'Yshunt': self.__puYshunt,
+            'Ydata': self.__puY.data, 'Yindices': self.__puY.indices, 'Yindptr': self.__puY.indptr,
+            'parent': self.__parent, 'parentLine': self.__parentLine,
+            'order': concatenate(self.__levels), 'levelSizes': array([len(level) for level in self.__levels]),
+            'radial': array(self.radial)
+        }
+
+
+    def __loadCompiledGrid(self, arrays):
+        # Inverse of __compiledGrid.
+        self.__lineFrom = arrays['lineFrom']
+        self.__lineTo = arrays['lineTo']
+        self.__puYline = arrays['Yline']
+        self.__puBline = arrays['Bline']
+        self.__puYshunt = arrays['Yshunt']
+        self.__puY = csr_matrix((arrays['Ydata'], arrays['Yindices'], arrays['Yindptr']),
+                                shape = (self.no_buses, self.no_buses))
+        self.__parent = arrays['parent']
+        self.__parentLine = arrays['parentLine']
+        self.__levels = split(arrays['order'], arrays['levelSizes'].cumsum()[:-1])
+        self.radial = bool(arrays['radial'])
+
+
+    def __laplacian(self, values):
+        # A diag(values) A.T for one value per line.
+        rows = concatenate((self.__lineFrom, self.__lineTo, self.__lineFrom, self.__lineTo))
+        cols = concatenate((self.__lineFrom, self.__lineTo, self.__lineTo, self.__lineFrom))
+
+        # Duplicate entries are summed up when converting to CSR.
+        return coo_matrix((concatenate((values, values, -values, -values)), (rows, cols)),
+                          shape = (self.no_buses, self.no_buses)).tocsr()
+
+
+    def __radial_structure(self):
+        # Orient the lines away from the slack bus with a breadth-first
+        # search.  The grid is radial if it is a tree spanning all buses.
+        adjacency = [[] for _ in range(self.no_buses)]
+        for line, (src, dst) in enumerate(zip(self.__lineFrom, self.__lineTo)):
+            adjacency[src].append((dst, line))
+            adjacency[dst].append((src, line))
+
+        self.__parent = full(self.no_buses, -1)
+        self.__parentLine = full(self.no_buses, -1)
+        depth = full(self.no_buses, -1)
+        depth[0] = 0
+        order = [0]
+        for bus in order:
+            for neighbour, line in adjacency[bus]:
+                if depth[neighbour] < 0:
+                    depth[neighbour] = depth[bus] + 1
+                    self.__parent[neighbour] = bus
+                    self.__parentLine[neighbour] = line
+                    order.append(neighbour)
+
+        self.radial = self.no_lines == self.no_buses - 1 and len(order) == self.no_buses
+
+        # Buses in topological order, split into levels of equal depth.  The
+        # buses of a level only depend on the buses of the previous level.
+        order = array(order)
+        self.__levels = split(order, flatnonzero(diff(depth[order])) + 1)
+
+
+    def __powerInjections(self, puV):
+        # S = V * conj(Y V) at every bus.
+        return puV * conjugate(self.__puYsparse @ puV)
+
+
+    def __jacobian(self, puV):
+        # Derivatives of S with respect to the real and imaginary parts of the
+        # voltages, restricted to the PQ buses:
+        #   dS/dVR = diag(conj(I)) + diag(V) conj(Y)
+        #   dS/dVX = j (diag(conj(I)) - diag(V) conj(Y))
+        diagI = diags(conjugate(self.__puYsparse @ puV))
+        diagVconjY = diags(puV) @ self.__puYsparse.conjugate()
+        dSdVR = (diagI + diagVconjY).tocsr()[1:, 1:]
+        dSdVX = (1j * (diagI - diagVconjY)).tocsr()[1:, 1:]
+
+        return bmat([[dSdVR.real, dSdVX.real], [dSdVR.imag, dSdVX.imag]], format = 'csc')
+
+
+    def __hasConverged(self, deltaV, V):
+        residual = norm(deltaV, inf)
+        previous = self.residual
+        self.__increases = self.__increases + 1 if residual > previous else 0
+        self.residual = residual
+        return self.__withinTolerance(residual, V, previous)
+
+
+    def __diverging(self):
+        # Whether the residual is not finite, or increased at the last
+        # DIVERGENCE_ITERATIONS iterations.
+        return self.iterations > 0 and (not isfinite(self.residual) or
+                                        self.__increases >= DIVERGENCE_ITERATIONS)
+
+
+    def __withinTolerance(self, residual, V, previous = inf):
+        # The residual is within the tolerance, or stopped decreasing at the
+        # noise floor.
+        scale = norm(V, inf)
+        if residual >= previous and residual <= NOISE_FLOOR * scale:
+            return True
+        if self.tolerance_mode == 'relative':
+            return residual <= self.tolerance * scale
+        return residual <= self.tolerance
+
+
+    def __iterations(self):
+        # Count the iterations of a solver, stopping at max_iter or once it
+        # diverges.
+        self.__iterationStart = timer()
+        self.iterations = 0
+        self.residual = inf
+        self.__increases = 0
+        self.converged = False
+        while (self.max_iter is None or self.iterations < self.max_iter) and not self.__diverging():
+            self.iterations += 1
+            yield self.iterations
+
+
+    def __solveYll(self, rhs):
+        # Solve Yll X = rhs for the current topology.
+        if len(self.__openLines) == 0:
+            return self.__solveBaseYll(rhs)
+        if self.__switchedSolveYll is None:
+            self.__switchedSolveYll = self.__switchedSolver()
+        return self.__switchedSolveYll(rhs)
+
+
+    def __solveBaseYll(self, rhs):
+        # Solve Yll X = rhs with the factors of Yll of the closed grid.
+        # Algorithms other than CW factorize Yll with a sparse LU on first
+        # use.
+        if self.algorithm == 'CW':
+            return lu_solve(self.__puYllLUpiv, rhs)
+        if self.__puYllLU is None:
+            self.__puYllLU = splu(self.__puYbase[1:, 1:].tocsc())
+        return self.__puYllLU.solve(rhs)
+
+
+    def __switchedSolver(self):
+        # Solver of Yll with the open lines: a low-rank update of the factors
+        # of the closed grid if few buses are affected, and otherwise a new
+        # sparse factorization.
+        ends, _ = self.__lineChange(self.__openLines)
+        if len(ends) <= REFACTORIZATION_BUSES:
+            solveYll, _ = self.__lowRankSolver(self.__openLines)
+            return solveYll
+        return splu(self.__puYsparse[1:, 1:].tocsc()).solve
 
 
     def __solveCW(self):
-        deltaVpu = full((self.no_buses - 1, 1), 1)
-        while norm(deltaVpu, inf) > self.tolerance:
-            puC = vstack(divide(conjugate(self.__puS), conjugate(self.__puVk).flatten()))
-            puX = solve(self.__puL, puC)
-            puVkplus1 = solve(self.__puU, puX) + self.__puW
+        for _ in self.__iterations():
+            puC = (conjugate(self.__puS) / conjugate(self.__puVk).ravel())[:, None]
+            puVkplus1 = self.__solveYll(puC) + self.__puW
             deltaVpu = puVkplus1 - self.__puVk
             self.__puVk = puVkplus1
+            if self.__hasConverged(deltaVpu, self.__puVk):
+                self.converged = True
+                break
 
 
-    def __solveNR(self):
-        puVRVXinitial = append(self.__puVR, self.__puVX)
-        puPQtarget = append(self.__puP, self.__puQ)
+    def __solveBFS(self):
+        puS = concatenate(([0], self.__puS))
+        puJ = zeros(self.no_buses, dtype = complex)
+
+        for _ in self.__iterations():
+            # Backward sweep: current drawn by every bus, accumulated from the
+            # leaves towards the slack bus into the line currents.
+            puJ[:] = self.__puYshunt * self.__puV - conjugate(puS / self.__puV)
+            for level in reversed(self.__levels[1:]):
+                add.at(puJ, self.__parent[level], puJ[level])
+
+            # Forward sweep: voltage drops from the slack bus to the leaves.
+            puVkplus1 = self.__puV.copy()
+            for level in self.__levels[1:]:
+                puVkplus1[level] = puVkplus1[self.__parent[level]] - self.__puZparent[level] * puJ[level]
+
+            deltaVpu = puVkplus1 - self.__puV
+            self.__puV = puVkplus1
+            if self.__hasConverged(deltaVpu, self.__puV):
+                self.converged = True
+                break
 
-        deltaVRVX = ones(self.no_buses)
 
-        while norm(deltaVRVX, inf) > self.tolerance:
-            J = self.__Jacob(puVRVXinitial)
-            puPQinitial = self.__calculPQ(puVRVXinitial)
-            deltaPQ = subtract(puPQtarget, puPQinitial)
+    def __solveFDLF(self):
+        puVm = absolute(self.__puV)
+        puVa = angle(self.__puV)
 
-            deltaVRVX = dot(inv(J), deltaPQ)
-            deltaVRVX = insert(deltaVRVX, [0, self.no_buses - 1], 0)
+        for _ in self.__iterations():
+            # P-theta half iteration.
+            deltaP = (self.__puS.real - self.__powerInjections(self.__puV)[1:].real) / puVm[1:]
+            deltaVa = self.__puBpLU.solve(deltaP)
+            puVa[1:] += deltaVa
+            self.__puV = puVm * exp(1j * puVa)
+
+            # Q-V half iteration.
+            deltaQ = (self.__puS.imag - self.__powerInjections(self.__puV)[1:].imag) / puVm[1:]
+            deltaVm = self.__puBppLU.solve(deltaQ)
+            puVm[1:] += deltaVm
+            self.__puV = puVm * exp(1j * puVa)
+
+            if self.__hasConverged(concatenate((deltaVa, deltaVm)), puVm):
+                self.converged = True
+                break
+
+
+    def __solveNR(self):
+        u = self.no_buses - 1 # u is the number of PQ buses
+        puV = self.__puVR + 1j * self.__puVX
+        puStarget = self.__puP + 1j * self.__puQ
 
-            puVRVXinitial = add(puVRVXinitial, deltaVRVX)
+        for _ in self.__iterations():
+            deltaS = puStarget - self.__powerInjections(puV)[1:]
+            deltaVRVX = spsolve(self.__jacobian(puV), concatenate((deltaS.real, deltaS.imag)))
 
-        self.__puVR = puVRVXinitial[:self.no_buses]
-        self.__puVX = puVRVXinitial[self.no_buses:]
+            puV[1:] += deltaVRVX[:u] + 1j * deltaVRVX[u:]
+            if self.__hasConverged(deltaVRVX, puV):
+                self.converged = True
+                break
+
+        self.__puVR = puV.real
+        self.__puVX = puV.imag
 
 
     def update(self, listP, listQ, slackVR, slackVX):
+        self.__solveStart = self.__iterationStart = timer()
+        # Warm start only from a converged solution.
+        warm = self.warm_start and self.converged
+
         self.pqBusesP = listP
         self.pqBusesQ = listQ
 
-        if self.algorithm == 'CW':
-            self.__puW = - dot(self.__puYllInv, vstack(self.__puY[:, 0][1:])) * complex(slackVR, slackVX) / self.baseV
+        self.approximated = False
+        if self.approximate and self.__linearization is not None:
+            puS = (array(listP) + 1j * array(listQ)) / self.baseS
+            self.__dirty = set(flatnonzero(puS - self.__linearization['puS']))
+            puV = self.__estimate(puS, complex(slackVR, slackVX) / self.baseV, sorted(self.__dirty))
+            if self.__accept(puV, puS):
+                self.__record(incremental = False)
+                return self.iterations
+
+        if self.algorithm in ('CW', 'SCW'):
+            puW = self.__noLoadVoltage(complex(slackVR, slackVX) / self.baseV)
             self.__puS = (array(listP) + 1j * array(listQ)) / self.baseS
 
-            self.__puVk = self.__puW
+            # W is linear in the slack voltage, so shift the previous solution
+            # by the change of W.
+            if warm:
+                self.__puVk = self.__puVk + puW - self.__puW
+            else:
+                self.__puVk = puW
+            self.__puW = puW
             self.__solveCW()
 
             self.__puVR = append([slackVR / self.baseV], self.__puVk.real)
             self.__puVX = append([slackVX / self.baseV], self.__puVk.imag)
 
+        elif self.algorithm in ('BFS', 'FDLF'):
+            self.__puS = (array(listP) + 1j * array(listQ)) / self.baseS
+            if warm:
+                put(self.__puV, 0, complex(slackVR, slackVX) / self.baseV)
+            else:
+                self.__puV = full(self.no_buses, complex(slackVR, slackVX) / self.baseV)
+            if self.algorithm == 'BFS':
+                self.__solveBFS()
+            else:
+                self.__solveFDLF()
+
+            self.__puVR = self.__puV.real
+            self.__puVX = self.__puV.imag
+
         elif self.algorithm == 'NR':
             #Initialize the values of P, Q, Vreal, Vimg in p.u.
             self.__puP = array(listP) / self.baseS
             self.__puQ = array(listQ) / self.baseS
-            self.__puVR = full(self.no_buses, slackVR / self.baseV)
-            self.__puVX = full(self.no_buses, slackVX / self.baseV)
+            if warm:
+                put(self.__puVR, 0, slackVR / self.baseV)
+                put(self.__puVX, 0, slackVX / self.baseV)
+            else:
+                self.__puVR = full(self.no_buses, slackVR / self.baseV)
+                self.__puVX = full(self.no_buses, slackVX / self.baseV)
 
 	        # Load-flow analysis.
             self.__solveNR()
 
         self.realV =  self.__puVR * self.baseV
         self.imagV =  self.__puVX * self.baseV
+        self.__solved()
+        self.__linearize()
+        self.__record(incremental = False)
+
+        return self.iterations
 
 
     def updatebus(self, index, newP, newQ):
-        if self.algorithm == 'CW':
-            put(self.__puS, index - 1, complex(newP, newQ) / self.baseS)
+        return self.updatebuses([index], [newP], [newQ])
 
-            self.__solveCW()
 
-        elif self.algorithm == 'NR':
-            put(self.__puP, index - 1, newP / self.baseS)
-            put(self.__puQ, index - 1, newQ / self.baseS)
+    def updatebuses(self, indices, listP, listQ, slackVR = None, slackVX = None):
+        """Update the power of a few buses, and possibly the slack voltage.
+
+        The other buses keep their power from the last load flow.  The buses
+        that changed since the last exact solution are tracked, and the new
+        voltages are first estimated from the sensitivities of the voltages to
+        the power of these buses (one rank-one correction per bus).  The
+        estimate is accepted as is in the approximate mode if it is accurate
+        enough, and otherwise used as the starting point of the solver.
+
+        Parameters
+        ----------
+            indices : list of int
+                Index of the buses to update.
 
+            listP, listQ : list of float
+                New active (W) and reactive (Var) power of these buses.
+
+            slackVR, slackVX : float (optional)
+                New slack voltage (V); by default the slack voltage is kept.
+
+        Returns
+        -------
+            iterations : int
+                Number of iterations of the solver (0 if the estimate was
+                accepted).
+
+        """
+        self.__solveStart = self.__iterationStart = timer()
+        puV, puS = self.__getState()
+        puV = puV.copy()
+        puS = puS.copy()
+        indices = asarray(indices, dtype = int)
+        puS[indices - 1] = (asarray(listP, dtype = float) + 1j * asarray(listQ, dtype = float)) / self.baseS
+        if slackVR is not None:
+            puV[0] = complex(slackVR, slackVX) / self.baseV
+        if not self.converged:
+            # Start from the no-load voltage, as update does, rather than
+            # from a diverged solution.
+            puV = self.__flatVoltage(puV[0])
+
+        self.pqBusesP = list(self.pqBusesP)
+        self.pqBusesQ = list(self.pqBusesQ)
+        for index, newP, newQ in zip(indices, listP, listQ):
+            self.pqBusesP[index - 1] = newP
+            self.pqBusesQ[index - 1] = newQ
+
+        self.approximated = False
+        if self.__linearization is not None:
+            self.__dirty.update(indices - 1)
+            puV = self.__estimate(puS, puV[0], sorted(self.__dirty))
+            if self.approximate and self.__accept(puV, puS):
+                self.__record(incremental = True)
+                return self.iterations
+
+        # Run the solver from the estimate.
+        self.__setState(puV, puS)
+        if self.algorithm in ('CW', 'SCW'):
+            self.__solveCW()
+            self.__puVR = append(puV[0].real, self.__puVk.real)
+            self.__puVX = append(puV[0].imag, self.__puVk.imag)
+        elif self.algorithm == 'BFS':
+            self.__solveBFS()
+            self.__puVR = self.__puV.real
+            self.__puVX = self.__puV.imag
+        elif self.algorithm == 'FDLF':
+            self.__solveFDLF()
+            self.__puVR = self.__puV.real
+            self.__puVX = self.__puV.imag
+        elif self.algorithm == 'NR':
             self.__solveNR()
 
+        self.realV =  self.__puVR * self.baseV
+        self.imagV =  self.__puVX * self.baseV
+        self.__solved()
+        self.__linearize()
+        self.__record(incremental = True)
+
+        return self.iterations
+
+
+    def __accept(self, puV, puS):
+        # Accept an estimate of the approximate mode as the new state.
+        if self.residual > self.approximation_tolerance:
+            # The operating point drifted too far from the Jacobian.
+            self.__linearization['LU'] = None
+            return False
+
+        self.__setState(puV, puS)
+        self.iterations = 0
+        self.converged = True
+        self.approximated = True
+        self.realV = puV.real * self.baseV
+        self.imagV = puV.imag * self.baseV
+        self.__solved()
+        return True
+
+
+    def __solved(self):
+        # A new solution invalidates the derived quantities.
+        self.__solveEnd = timer()
+        self.version += 1
+        self.__derived.clear()
+
+
+    def __record(self, incremental):
+        # Append the last load flow to the solve history.  An accepted
+        # estimate counts as the iteration.
+        self.solves.append({
+            'version': self.version,
+            'algorithm': self.algorithm,
+            'incremental': incremental,
+            'approximated': self.approximated,
+            'iterations': self.iterations,
+            'residual': float(self.residual),
+            'converged': self.converged,
+            'assembly': self.__iterationStart - self.__solveStart,
+            'iteration': self.__solveEnd - self.__iterationStart,
+            'postprocessing': timer() - self.__solveEnd
+        })
+
+
+    def __noLoadVoltage(self, puV0):
+        # W = - Yll^-1 Yl0 V0, the voltages of the PQ buses at no load.
+        return self.__puWunit * puV0
+
+
+    def __flatVoltage(self, puV0):
+        # Voltages of all buses (p.u.) at the start of a cold load flow.
+        if self.algorithm in ('CW', 'SCW'):
+            return concatenate(([puV0], self.__noLoadVoltage(puV0).ravel()))
+        return full(self.no_buses, puV0, dtype = complex)
+
+
+    def __getState(self):
+        # Voltages of all buses and power of the PQ buses (p.u.) of the last
+        # load flow, whatever the algorithm.
+        if self.algorithm in ('CW', 'SCW'):
+            return concatenate(([complex(self.__puVR[0], self.__puVX[0])], self.__puVk.ravel())), self.__puS
+        if self.algorithm in ('BFS', 'FDLF'):
+            return self.__puV, self.__puS
+        return self.__puVR + 1j * self.__puVX, self.__puP + 1j * self.__puQ
+
+
+    def __setState(self, puV, puS):
+        # Inverse of __getState, e.g., to continue from an estimate.
+        if self.algorithm in ('CW', 'SCW'):
+            self.__puW = self.__noLoadVoltage(puV[0])
+            self.__puVk = puV[1:, None]
+            self.__puS = puS
+            self.__puVR = puV.real
+            self.__puVX = puV.imag
+        elif self.algorithm in ('BFS', 'FDLF'):
+            self.__puV = puV.copy()
+            self.__puS = puS
+        else:
+            self.__puVR = puV.real
+            self.__puVX = puV.imag
+            self.__puP = puS.real
+            self.__puQ = puS.imag
+
+
+    def __linearize(self):
+        # Use the last (exact) solution as the operating point of the
+        # estimates.  The Jacobian is factorized lazily, on the first
+        # estimate, and kept until the operating point drifts away.
+        self.__dirty.clear()
+        if not self.converged:
+            self.__linearization = None
+            return
+
+        puV, puS = self.__getState()
+        if self.__linearization is None:
+            self.__linearization = {'LU': None}
+        elif self.__linearization['LU'] is not None and \
+                norm(puV - self.__linearization['puVJ'], inf) > SENSITIVITY_DRIFT:
+            self.__linearization['LU'] = None
+        self.__linearization['puV'] = puV.copy()
+        self.__linearization['puS'] = puS.copy()
+
+
+    def __sensitivities(self, buses):
+        # Sensitivities of the voltages (real and imaginary parts of the PQ
+        # buses) to the active and reactive power of the given buses, one
+        # pair of columns per bus, computed on first use.
+        linearization = self.__linearization
+        u = self.no_buses - 1
+        missing = [bus for bus in buses if bus not in linearization['columns']]
+        if missing:
+            E = zeros((2 * u, 2 * len(missing)))
+            E[missing, range(0, 2 * len(missing), 2)] = 1
+            E[[u + bus for bus in missing], range(1, 2 * len(missing), 2)] = 1
+            columns = linearization['LU'].solve(E)
+            for i, bus in enumerate(missing):
+                linearization['columns'][bus] = columns[:, 2 * i:2 * i + 2]
+
+        return [linearization['columns'][bus] for bus in buses]
+
+
+    def __estimate(self, puS, puV0, buses):
+        # Linear estimate of the voltages around the operating point:
+        #   J dV = dS - dS/dV0 dV0
+        # where J is the Jacobian of the power of the PQ buses and dS is
+        # nonzero at the given buses only.  The power mismatch of the
+        # estimate is stored in residual.
+        linearization = self.__linearization
+        u = self.no_buses - 1
+        if linearization['LU'] is None:
+            puV = linearization['puV']
+            linearization['puVJ'] = puV
+            linearization['LU'] = splu(self.__jacobian(puV))
+            linearization['columns'] = {}
+            # dS/dV0R = V conj(Yl0) and dS/dV0X = -j V conj(Yl0).
+            dSdV0R = puV[1:] * conjugate(self.__puYl0.ravel())
+            linearization['slack'] = linearization['LU'].solve(
+                vstack((concatenate((dSdV0R.real, dSdV0R.imag)),
+                        concatenate((dSdV0R.imag, - dSdV0R.real)))).T)
+
+        self.__iterationStart = timer()
+        deltaS = puS - linearization['puS']
+        if len(buses) <= SENSITIVITY_BUSES:
+            deltaVRVX = zeros(2 * u)
+            for bus, columns in zip(buses, self.__sensitivities(buses)):
+                deltaVRVX += columns @ (deltaS[bus].real, deltaS[bus].imag)
+        else:
+            deltaVRVX = linearization['LU'].solve(concatenate((deltaS.real, deltaS.imag)))
+
+        deltaV0 = puV0 - linearization['puV'][0]
+        if deltaV0 != 0:
+            deltaVRVX -= linearization['slack'] @ (deltaV0.real, deltaV0.imag)
+
+        puV = linearization['puV'].copy()
+        puV[0] = puV0
+        puV[1:] += deltaVRVX[:u] + 1j * deltaVRVX[u:]
+
+        self.residual = norm(puS - self.__powerInjections(puV)[1:], inf)
+        return puV
+
+
+    def switch_line(self, line, closed):
+        """Open or close a line, e.g., to reconfigure the grid or isolate a fault.
+
+        The admittance matrix is patched in place, and the factors of Yll are
+        updated incrementally: as long as the open lines touch few buses, the
+        factors of the closed grid are kept and corrected with a low-rank
+        update, and Yll is refactorized otherwise.  The new topology is used
+        from the next load flow on.
+
+        Parameters
+        ----------
+            line : int
+                Index of the line.
+
+            closed : bool
+                Whether to close (True) or to open (False) the line.
+
+        Returns
+        -------
+            switched : bool
+                Whether the topology changed, i.e., False if the line was
+                already closed or open.
+
+        Raises
+        ------
+            error : ValueError
+                Wrong line index, the backward/forward sweep is used (it
+                requires the radial structure of the closed grid), or opening
+                the line would disconnect some buses from the slack bus.
+
+        """
+        line = int(line)
+        if not 0 <= line < self.no_lines:
+            raise ValueError("Unknown line: {}".format(line))
+        if self.algorithm == 'BFS':
+            raise ValueError("Lines cannot be switched with the backward/forward sweep")
+
+        isOpen = line in self.__openLines
+        if closed != isOpen:
+            return False  # Nothing to switch.
+
+        if closed:
+            openLines = setdiff1d(self.__openLines, [line])
+        else:
+            openLines = union1d(self.__openLines, [line])
+            if not self.__energizedBuses(openLines).all():
+                raise ValueError("Opening line {} would disconnect some buses".format(line))
+        self.__openLines = openLines.astype(int)
+
+        # Patch the admittance matrix with the change of the switched line.
+        ends, C = self.__lineChange([line])
+        if closed:
+            C = - C
+        if len(self.__openLines) == 0:
+            self.__puYsparse = self.__puYbase
+        else:
+            self.__puYsparse = self.__outageAdmittance(self.__openLines)
+        self.__puYslack = self.__puYsparse[[0]]
+        if self.algorithm == 'CW':
+            if not self.__puY.flags.writeable:
+                # The matrices are memory-mapped from the cache.
+                self.__puY = array(self.__puY)
+                self.siY = array(self.siY)
+            self.__puY[ix_(ends, ends)] += C
+            self.siY[ix_(ends, ends)] += C * self.Ybase
+        else:
+            self.__puY = self.__puYsparse
+            self.siY = self.__puY * self.Ybase
+        self.__puYl0 = self.__puYsparse[1:, [0]].toarray()
+
+        # Update the factorizations, and forget the linearization of the
+        # previous topology.
+        self.__switchedSolveYll = None
+        if self.algorithm in ('CW', 'SCW'):
+            self.__puWunit = - self.__solveYll(self.__puYl0)
+        elif self.algorithm == 'FDLF':
+            puBline = 1 / (1 / self.__puYline).imag
+            puBline[self.__openLines] = 0
+            self.__puBpLU = splu(self.__laplacian(puBline)[1:, 1:].tocsc())
+            self.__puBppLU = splu(- self.__puYsparse[1:, 1:].imag.tocsc())
+        self.__linearization = None
+        self.__dirty.clear()
+        return True
+
+
+    @property
+    def open_lines(self):
+        # Index of the lines that are currently open.
+        return tuple(self.__openLines.tolist())
+
+
+    def update_batch(self, P_matrix, Q_matrix, slack_voltages):
+        """Solve several load-flow scenarios at once.
+
+        The CW iteration is run on all scenarios together, so that every
+        iteration applies the factors of Yll to a matrix instead of a vector.
+        The state of the grid (realV, imagV, ...) is left untouched; the
+        number of iterations and whether all scenarios converged are stored in
+        batch_iterations and batch_converged.
+
+        Parameters
+        ----------
+            P_matrix : array_like, shape (K, no_buses - 1)
+                Active power (in W) of the PQ buses, one scenario per row.
+
+            Q_matrix : array_like, shape (K, no_buses - 1)
+                Reactive power (in Var) of the PQ buses, one scenario per row.
+
+            slack_voltages : complex or array_like, shape (K, )
+                Slack bus voltage (in V) of every scenario.
+
+        Returns
+        -------
+            voltages : numpy.ndarray, shape (K, no_buses)
+                Complex bus voltages (in V).
+
+            slack_powers : numpy.ndarray, shape (K, )
+                Complex power (in VA) of the slack bus.
+
+            forward_currents : numpy.ndarray, shape (K, no_lines)
+                Complex current (in A) leaving the 'from' bus of every line.
+
+            backward_currents : numpy.ndarray, shape (K, no_lines)
+                Complex current (in A) leaving the 'to' bus of every line.
+
+        """
+        puS, puV0 = self.__batchInjections(P_matrix, Q_matrix, slack_voltages)
+        puVk = self.__solveBatchCW(puS, puV0, self.__solveYll, self.__puYl0)
+
+        return self.__batchResults(vstack((puV0, puVk)), self.__openLines)
+
+
+    def update_outage(self, lines, P_matrix, Q_matrix, slack_voltages):
+        """Solve load-flow scenarios with some lines out of service.
+
+        The factors of Yll are not recomputed: the removal of the lines is a
+        low-rank change of Yll, which is applied to the base-case factors with
+        the Woodbury identity.  If the outage disconnects some buses from the
+        slack bus, these buses are de-energized (zero voltage, load shed) and
+        the rest of the grid is refactorized.  The lines opened with
+        `switch_line` are out of service as well.  As with `update_batch`, the
+        state of the grid is left untouched, and the buses that remain
+        energized are stored in outage_energized.
+
+        Parameters
+        ----------
+            lines : int or array_like
+                Index of the lines out of service.
+
+            P_matrix, Q_matrix, slack_voltages
+                Scenarios, as in `update_batch`.
+
+        Returns
+        -------
+            Same as `update_batch`, with zero voltages at the de-energized
+            buses and zero currents in the lines out of service.
+
+        """
+        lines = union1d(atleast_1d(lines), self.__openLines).astype(int)
+        puS, puV0 = self.__batchInjections(P_matrix, Q_matrix, slack_voltages)
+
+        self.outage_energized = self.__energizedBuses(lines)
+        if self.outage_energized.all():
+            solveYll, puYl0 = self.__lowRankSolver(lines)
+            puVpq = self.__solveBatchCW(puS, puV0, solveYll, puYl0)
+        else:
+            # Refactorize the admittance matrix of the energized buses.
+            pq = flatnonzero(self.outage_energized[1:]) + 1
+            puVpq = zeros((self.no_buses - 1, puS.shape[1]), dtype = complex)
+            self.batch_iterations = 0
+            self.batch_converged = True
+            if len(pq) > 0:
+                puY = self.__outageAdmittance(lines)
+                puYllLU = splu(puY[pq][:, pq].tocsc())
+                puVpq[pq - 1] = self.__solveBatchCW(puS[pq - 1], puV0, puYllLU.solve, puY[pq][:, [0]].toarray())
+
+        return self.__batchResults(vstack((puV0, puVpq)), lines)
+
+
+    def __batchInjections(self, P_matrix, Q_matrix, slack_voltages):
+        # Power of the PQ buses (one column per scenario) and slack voltages,
+        # in p.u.
+        puS = (asarray(P_matrix, dtype = float) + 1j * asarray(Q_matrix, dtype = float)).T / self.baseS
+        puV0 = broadcast_to(asarray(slack_voltages, dtype = complex), puS.shape[1:]) / self.baseV
+        return puS, puV0
+
+
+    def __solveBatchCW(self, puS, puV0, solveYll, puYl0):
+        # CW iteration on several scenarios at once, for the given solver of
+        # Yll and column Yl0.
+        puW = - solveYll(puYl0) * puV0
+        puVk = puW
+        self.batch_iterations = 0
+        self.batch_converged = False
+        residual, increases = inf, 0
+        while self.max_iter is None or self.batch_iterations < self.max_iter:
+            self.batch_iterations += 1
+            puVkplus1 = solveYll(conjugate(puS / puVk)) + puW
+            deltaVpu = puVkplus1 - puVk
+            puVk = puVkplus1
+            previous, residual = residual, absolute(deltaVpu).max()
+            increases = increases + 1 if residual > previous else 0
+            if self.__withinTolerance(residual, puVk.ravel(), previous):
+                self.batch_converged = True
+                break
+            if not isfinite(residual) or increases >= DIVERGENCE_ITERATIONS:
+                break
+
+        return puVk
+
+
+    def __batchResults(self, puV, outage = ()):
+        # Voltages, slack power and line currents in SI of the solutions in
+        # the columns of puV, with no current in the lines out of service.
+        V = puV.T * self.baseV
+        forwardCurrents = self.__siYline * (V[:, self.__lineFrom] - V[:, self.__lineTo]) + \
+            self.__siBline * V[:, self.__lineFrom]
+        backwardCurrents = self.__siYline * (V[:, self.__lineTo] - V[:, self.__lineFrom]) + \
+            self.__siBline * V[:, self.__lineTo]
+        forwardCurrents[:, outage] = 0
+        backwardCurrents[:, outage] = 0
+
+        # The current injected at the slack bus flows into its lines.
+        slackCurrents = forwardCurrents[:, self.__lineFrom == 0].sum(axis = 1) + \
+            backwardCurrents[:, self.__lineTo == 0].sum(axis = 1)
+
+        return V, V[:, 0] * conjugate(slackCurrents), forwardCurrents, backwardCurrents
+
+
+    def __lineChange(self, lines):
+        # Removing lines changes Y by U C U.T, where U selects the buses at
+        # the ends of the lines and C is small and dense.
+        ends = unique(concatenate((self.__lineFrom[lines], self.__lineTo[lines])))
+        position = {bus: i for i, bus in enumerate(ends)}
+        C = zeros((len(ends), len(ends)), dtype = complex)
+        for line in lines:
+            i = position[self.__lineFrom[line]]
+            j = position[self.__lineTo[line]]
+            C[i, i] -= self.__puYline[line] + self.__puBline[line]
+            C[j, j] -= self.__puYline[line] + self.__puBline[line]
+            C[i, j] += self.__puYline[line]
+            C[j, i] += self.__puYline[line]
+
+        return ends, C
+
+
+    def __lowRankSolver(self, lines):
+        # Solver of Yll + U C U.T from the factors of the closed-grid Yll
+        # (Woodbury identity):
+        #   X = Z - Yll^-1 U (I + C U.T Yll^-1 U)^-1 C U.T Z,  with Z = Yll^-1 rhs
+        # and the column Yl0 after the change.
+        ends, C = self.__lineChange(lines)
+        pq = ends != 0
+        pqEnds = ends[pq] - 1
+
+        puYl0 = self.__puYl0base.copy()
+        if not pq.all():
+            puYl0[pqEnds, 0] += C[pq, ~pq]
+        Cll = C[ix_(pq, pq)]
+
+        U = zeros((self.no_buses - 1, len(pqEnds)), dtype = complex)
+        U[pqEnds, range(len(pqEnds))] = 1
+        YllInvU = self.__solveBaseYll(U)
+        G = eye(len(pqEnds)) + Cll @ YllInvU[pqEnds]
+
+        def solveYll(rhs):
+            Z = self.__solveBaseYll(rhs)
+            return Z - YllInvU @ solve(G, Cll @ Z[pqEnds])
+
+        return solveYll, puYl0
+
+
+    def __energizedBuses(self, lines):
+        # Buses that remain connected to the slack bus without the lines.
+        inService = ones(self.no_lines, dtype = bool)
+        inService[lines] = False
+        graph = coo_matrix((ones(inService.sum()), (self.__lineFrom[inService], self.__lineTo[inService])),
+                           shape = (self.no_buses, self.no_buses))
+        _, labels = connected_components(graph, directed = False)
+
+        return labels == labels[0]
+
+
+    def __outageAdmittance(self, lines):
+        # Sparse admittance matrix of the closed grid without the lines.
+        ends, C = self.__lineChange(lines)
+        rows, cols = ix_(ends, ends)
+        change = coo_matrix((C.ravel(), (broadcast_to(rows, C.shape).ravel(), broadcast_to(cols, C.shape).ravel())),
+                            shape = (self.no_buses, self.no_buses))
+
+        return (self.__puYbase + change).tocsr()
+
+
+    def set_solution(self, realV, imagV, pqBusesP, pqBusesQ):
+        """Set the solution of a load flow solved by another instance of the grid.
+
+        The derived quantities (slack power and currents) are then computed
+        from this solution, for the current topology.  The state of the
+        solver is left as is.
+
+        Parameters
+        ----------
+            realV, imagV : numpy.ndarray
+                Real and imaginary part of the voltages (V) of all buses.
+
+            pqBusesP, pqBusesQ : list of float
+                Active (W) and reactive (Var) power of the PQ buses.
+
+        """
+        self.realV = asarray(realV)
+        self.imagV = asarray(imagV)
+        self.pqBusesP = pqBusesP
+        self.pqBusesQ = pqBusesQ
+        self.version += 1
+        self.__derived.clear()
+
 
     def computeSlackPower(self):
-        I = 0
-        for i in range(self.no_buses):
-            I += self.__puY[0, i] * complex(self.__puVR[i], self.__puVX[i])
-        S = complex(self.__puVR[0], self.__puVX[0]) * conjugate(I) * self.baseS
-        self.slackPower = (S.real, S.imag)
+        # S0 = V0 conj(Y0 V), where Y0 is the row of the slack bus.
+        puV = (self.realV + 1j * self.imagV) / self.baseV
+        S = puV[0] * conjugate(self.__puYslack @ puV)[0] * self.baseS
+        self.__derived['slackPower'] = (S.real, S.imag)
 
 
     def computeCurrents(self):
-        VRVX = self.realV + 1j * self.imagV
-        self.busCurrents = dot(self.siY, vstack(VRVX))
-
-        self.forwardCurrents = zeros(self.no_lines, dtype = complex)
-        self.backwardCurrents = zeros(self.no_lines, dtype = complex)
-        for i in range(self.no_lines):
-            src = self.lines[i][0]
-            dst = self.lines[i][1]
-            self.forwardCurrents[i] = -self.siY[src, dst] * (VRVX[src] - VRVX[dst]) + VRVX[src] * complex(0, 0.5) * self.lines[i][4]
-            self.backwardCurrents[i] = -self.siY[dst, src] * (VRVX[dst] - VRVX[src]) + VRVX[dst] * 0.5j * self.lines[i][4]
+        # Currents (in A) injected at every bus, and leaving the 'from' and
+        # 'to' bus of every line, as arrays.
+        self.__computeBusCurrents()
+        self.__computeLineCurrents()
+
+
+    def __computeBusCurrents(self):
+        V = self.realV + 1j * self.imagV
+        self.__derived['busCurrents'] = (self.__puYsparse @ V)[:, None] * self.Ybase
+
+
+    def __computeLineCurrents(self):
+        V = self.realV + 1j * self.imagV
+        Vfrom = V[self.__lineFrom]
+        Vto = V[self.__lineTo]
+        forwardCurrents = self.__siYline * (Vfrom - Vto) + self.__siBline * Vfrom
+        backwardCurrents = self.__siYline * (Vto - Vfrom) + self.__siBline * Vto
+        forwardCurrents[self.__openLines] = 0
+        backwardCurrents[self.__openLines] = 0
+        self.__derived['forwardCurrents'] = forwardCurrents
+        self.__derived['backwardCurrents'] = backwardCurrents
+
+
+    def __derive(self, key, compute):
+        # Quantity derived from the solution, computed on first access.  The
+        # time spent is post-processing of the last load flow.
+        if key not in self.__derived:
+            start = timer()
+            compute()
+            if self.solves and self.solves[-1]['version'] == self.version:
+                self.solves[-1]['postprocessing'] += timer() - start
+        return self.__derived[key]
+
+
+    @property
+    def slackPower(self):
+        # Active (W) and reactive (Var) power of the slack bus.
+        return self.__derive('slackPower', self.computeSlackPower)
+
+
+    @property
+    def busCurrents(self):
+        return self.__derive('busCurrents', self.__computeBusCurrents)
+
+
+    @property
+    def forwardCurrents(self):
+        return self.__derive('forwardCurrents', self.__computeLineCurrents)
+
+
+    @property
+    def backwardCurrents(self):
+        return self.__derive('backwardCurrents', self.__computeLineCurrents)
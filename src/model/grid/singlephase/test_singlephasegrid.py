@@ -0,0 +1,255 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Tests of the single-phase grid model.
+
+Run with `python -m pytest src/model/grid/singlephase` from the T-RECS root
+directory.
+
+"""
+
+from json import load
+from os import path
+
+from numpy import abs, allclose
+from pytest import raises
+from numpy.random import default_rng
+
+from singlephasegrid import SinglePhaseGrid, calibrate
+
+SAMPLE_GRID = path.join(path.dirname(path.abspath(__file__)), path.pardir, path.pardir, path.pardir,
+                        path.pardir, 'sample', 'conf', 'grid_config.json')
+
+
+def sample_config():
+    with open(SAMPLE_GRID) as f:
+        return load(f)['grid']
+
+
+def shipped_solver():
+    # Tolerance settings of the sample grid configuration.
+    with open(SAMPLE_GRID) as f:
+        solver = load(f)['grid']['solver']
+    return {key: solver[key] for key in ('voltage_tolerance', 'tolerance_mode', 'max_iter')}
+
+
+def meshed_config():
+    # The sample grid with an extra line (4, 12), which closes a loop, so that
+    # Yll is not factorized without pivoting.
+    config = sample_config()
+    config['lines'].append(dict(config['lines'][-1], **{'from': 4, 'to': 12}))
+    return config
+
+
+def injections(config, no_samples=1, seed=0):
+    # Light random loads (in W and Var) of the PQ buses, one scenario per
+    # row.
+    no_buses = max(max(line['from'], line['to']) for line in config['lines']) + 1
+    rng = default_rng(seed)
+    return (- rng.uniform(0, 5e3, (no_samples, no_buses - 1)),
+            - rng.uniform(0, 1e3, (no_samples, no_buses - 1)))
+
+
+def solve(config, P, Q, ALG, **kwargs):
+    # Voltages of a single load flow.
+    grid = SinglePhaseGrid(config, ALG=ALG, max_iter=200, **kwargs)
+    grid.update(list(P), list(Q), 400, 0)
+    assert grid.converged
+    return grid.realV + 1j * grid.imagV
+
+
+def test_dense_cw_meshed():
+    config = meshed_config()
+    P, Q = injections(config)
+    assert not SinglePhaseGrid(config).radial
+    assert allclose(solve(config, P[0], Q[0], 'CW'), solve(config, P[0], Q[0], 'NR'), rtol=0, atol=1e-8)
+
+
+def test_update_batch_meshed():
+    config = meshed_config()
+    P, Q = injections(config, no_samples=5)
+    for ALG in ('CW', 'SCW'):
+        grid = SinglePhaseGrid(config, ALG=ALG, max_iter=200)
+        assert not grid.radial
+        V, _, _, _ = grid.update_batch(P, Q, 400)
+        assert grid.batch_converged
+        for k in range(len(P)):
+            assert abs(V[k] - solve(config, P[k], Q[k], 'NR')).max() < 1e-8, (ALG, k)
+
+
+def test_updatebus_after_divergence():
+    # An incremental update must not start from a diverged solution.
+    config = sample_config()
+    P, Q = injections(config)
+    for ALG in ('CW', 'SCW', 'BFS', 'FDLF', 'NR'):
+        grid = SinglePhaseGrid(config, ALG=ALG, max_iter=200)
+        overloaded = list(P[0])
+        overloaded[11] = -5e7
+        grid.update(overloaded, list(Q[0]), 400, 0)
+        assert not grid.converged, ALG
+        grid.updatebus(12, P[0][11], Q[0][11])
+        assert grid.converged, ALG
+        assert abs(grid.realV + 1j * grid.imagV - solve(config, P[0], Q[0], 'NR')).max() < 1e-8, ALG
+
+
+def test_warm_start_shipped_solver():
+    # The shipped tolerance is reachable, so that a warm start saves
+    # iterations.
+    config = sample_config()
+    P, Q = injections(config)
+    for ALG in ('CW', 'NR', 'BFS', 'FDLF'):
+        grid = SinglePhaseGrid(config, ALG=ALG, **shipped_solver())
+        grid.update(list(P[0]), list(Q[0]), 400, 0)
+        assert grid.converged, ALG
+        cold = grid.iterations
+        grid.update(list(1.01 * P[0]), list(Q[0]), 400, 0)
+        assert grid.converged, ALG
+        assert grid.iterations < cold, ALG
+
+
+def test_fdlf_shipped_solver():
+    # FDLF converges to the NR solution on easy operating points, with the
+    # shipped tolerance and below the noise floor of its voltage update.
+    config = sample_config()
+    P, Q = injections(config, no_samples=20)
+    for kwargs in (shipped_solver(), {'voltage_tolerance': 1e-15}):
+        grid = SinglePhaseGrid(config, ALG='FDLF', **kwargs)
+        for k in range(len(P)):
+            grid.update(list(P[k]), list(Q[k]), 400, 0)
+            assert grid.converged, (kwargs, k)
+            assert abs(grid.realV + 1j * grid.imagV - solve(config, P[k], Q[k], 'NR')).max() < 1e-6, (kwargs, k)
+
+
+def test_calibrate_keeps_fdlf():
+    _, calibration = calibrate(sample_config(), **shipped_solver())
+    assert calibration['FDLF']['converged']
+
+
+def test_cw_backends():
+    # The dense and sparse CW iterations agree with NR on the radial and the
+    # meshed grid.
+    for config in (sample_config(), meshed_config()):
+        P, Q = injections(config)
+        reference = solve(config, P[0], Q[0], 'NR')
+        for ALG in ('CW', 'SCW'):
+            assert abs(solve(config, P[0], Q[0], ALG) - reference).max() < 1e-8, ALG
+
+
+def test_bfs_radial():
+    # The backward/forward sweep agrees with NR on the radial grid, and
+    # rejects the meshed grid.
+    config = sample_config()
+    P, Q = injections(config, no_samples=3)
+    for k in range(len(P)):
+        assert abs(solve(config, P[k], Q[k], 'BFS') - solve(config, P[k], Q[k], 'NR')).max() < 1e-8, k
+    with raises(ValueError):
+        SinglePhaseGrid(meshed_config(), ALG='BFS')
+
+
+def test_update_outage():
+    # An outage of the loop line of the meshed grid gives the radial grid,
+    # and an outage of the line to bus 12 of the radial grid de-energizes it,
+    # as if the line and the bus were removed.
+    config = meshed_config()
+    P, Q = injections(config, no_samples=2)
+    grid = SinglePhaseGrid(config, max_iter=200)
+
+    V, _, forward, _ = grid.update_outage(len(config['lines']) - 1, P, Q, 400)
+    assert grid.batch_converged
+    assert (forward[:, -1] == 0).all()
+    for k in range(len(P)):
+        assert abs(V[k] - solve(sample_config(), P[k], Q[k], 'NR')).max() < 1e-8, k
+
+    config = sample_config()
+    grid = SinglePhaseGrid(config, max_iter=200)
+    line = next(i for i, l in enumerate(config['lines']) if (l['from'], l['to']) == (11, 12))
+    reduced = sample_config()
+    reduced['lines'] = [l for l in reduced['lines'] if l['to'] != 12]
+    V, _, _, _ = grid.update_outage(line, P, Q, 400)
+    assert not grid.outage_energized[12] and grid.outage_energized[:12].all()
+    assert (V[:, 12] == 0).all()
+    for k in range(len(P)):
+        assert abs(V[k, :12] - solve(reduced, P[k, :11], Q[k, :11], 'NR')).max() < 1e-8, k
+
+
+def test_approximate():
+    # A small change of power is estimated from the sensitivities, and a
+    # large one is solved exactly.
+    config = sample_config()
+    P, Q = injections(config, no_samples=2)
+    grid = SinglePhaseGrid(config, ALG='NR', max_iter=200, approximate=True)
+    grid.update(list(P[0]), list(Q[0]), 400, 0)
+    assert not grid.approximated
+
+    P[0][4] += 10
+    grid.update(list(P[0]), list(Q[0]), 400, 0)
+    assert grid.approximated and grid.iterations == 0
+    assert abs(grid.realV + 1j * grid.imagV - solve(config, P[0], Q[0], 'NR')).max() < 1e-4
+
+    grid.update(list(P[1]), list(Q[1]), 400, 0)
+    assert not grid.approximated and grid.converged
+    assert abs(grid.realV + 1j * grid.imagV - solve(config, P[1], Q[1], 'NR')).max() < 1e-8
+
+    # updatebus goes through the same estimate.
+    grid.updatebus(5, P[1][4] + 10, Q[1][4])
+    assert grid.approximated
+
+
+def test_cache_round_trip(tmp_path):
+    # A grid compiled from the cache solves as the grid it was stored from,
+    # and another topology is stored under another key.
+    config = sample_config()
+    P, Q = injections(config)
+    reference = solve(config, P[0], Q[0], 'CW')
+    for ALG in ('CW', 'CW', 'BFS'):
+        assert abs(solve(config, P[0], Q[0], ALG, cache_path=str(tmp_path)) - reference).max() < 1e-8, ALG
+    key, = tmp_path.iterdir()
+    assert sorted(entry.name for entry in key.iterdir()) == ['CW', 'grid']
+
+    solve(meshed_config(), P[0], Q[0], 'SCW', cache_path=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_switch_line():
+    # Opening the loop line of the meshed grid gives the radial grid, and
+    # closing it again the meshed grid.  A line whose opening would
+    # disconnect buses stays closed.
+    config = meshed_config()
+    loop = len(config['lines']) - 1
+    P, Q = injections(config)
+    radial = solve(sample_config(), P[0], Q[0], 'NR')
+    meshed = solve(config, P[0], Q[0], 'NR')
+    for ALG in ('CW', 'SCW', 'NR', 'FDLF'):
+        grid = SinglePhaseGrid(config, ALG=ALG, max_iter=200)
+        assert grid.switch_line(loop, False) and not grid.switch_line(loop, False)
+        assert grid.open_lines == (loop,)
+        grid.update(list(P[0]), list(Q[0]), 400, 0)
+        assert abs(grid.realV + 1j * grid.imagV - radial).max() < 1e-8, ALG
+        assert grid.forwardCurrents[loop] == 0 and grid.backwardCurrents[loop] == 0
+
+        with raises(ValueError):
+            grid.switch_line(0, False)
+
+        assert grid.switch_line(loop, True)
+        grid.updatebus(1, P[0][0], Q[0][0])
+        assert abs(grid.realV + 1j * grid.imagV - meshed).max() < 1e-8, ALG
@@ -0,0 +1,56 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Tests of the three-phase grid model.
+
+Run with `python -m pytest src/model/grid/threephase` from the T-RECS root
+directory.
+
+"""
+
+from json import load
+from os import path
+
+from threephasegrid import ThreePhaseGrid
+
+SAMPLE_GRID = path.join(path.dirname(path.abspath(__file__)), path.pardir, path.pardir, path.pardir,
+                        path.pardir, 'sample', 'conf', 'grid_config.json')
+
+
+def sample_config():
+    with open(SAMPLE_GRID) as f:
+        return load(f)['grid']
+
+
+def test_overloaded_grid():
+    # The load flow of an overloaded grid stops instead of running forever.
+    config = sample_config()
+    grid = ThreePhaseGrid(config)
+    P = [- 1e3] * (grid.no_buses - 1)
+    Q = [0] * (grid.no_buses - 1)
+    grid.update(P, Q, 400, 0)
+    assert grid.converged
+
+    P[11] = - 5e7
+    grid.update(P, Q, 400, 0)
+    assert not grid.converged
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from numpy import array, eye, full, exp, pi, sqrt, inf, conjugate, concatenate, arange, \
+    broadcast_to, einsum, isfinite, asarray
+from numpy.linalg import inv, norm
+from collections import deque
+from operator import itemgetter
+from timeit import default_timer as timer
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import splu
+
+
+PHASES = 3
+
+# Rotation of the phases of the slack voltage: phase 1 at 0 degrees, phase 2
+# at +120 degrees and phase 3 at -120 degrees, as in the sensor module.
+PHASE_ROTATION = exp(1j * array([0, 2 * pi / 3, - 2 * pi / 3]))
+
+# Number of load flows kept in the solve history.
+SOLVE_HISTORY = 1000
+
+# Default maximum number of iterations of a load flow, and number of
+# consecutive increases of the residual after which a load flow is stopped
+# as divergent, as for SinglePhaseGrid.
+MAX_ITER = 1000
+DIVERGENCE_ITERATIONS = 10
+
+# Default tolerance (p.u.) on the voltage update, and relative noise floor of
+# the voltage update, as for SinglePhaseGrid.
+VOLTAGE_TOLERANCE = 1e-10
+NOISE_FLOOR = 1e-12
+
+
+def line_matrices(line):
+    """3x3 series impedance (in Ohm) and shunt susceptance (in S) of a line.
+
+    The impedance is given by 'R_matrix' and 'X_matrix', or is built from the
+    positive- ('R', 'X') and zero-sequence ('R0', 'X0') impedances, or from
+    'R' and 'X' alone (no coupling between the phases).  The susceptance is
+    given by 'B_matrix', or 'B' for every phase.
+
+    """
+    if 'R_matrix' in line:
+        Z = array(line['R_matrix']) + 1j * array(line['X_matrix'])
+    elif 'R0' in line:
+        Z1 = complex(line['R'], line['X'])
+        Z0 = complex(line['R0'], line['X0'])
+        # Self impedance (Z0 + 2 Z1) / 3 and mutual impedance (Z0 - Z1) / 3.
+        Z = full((PHASES, PHASES), (Z0 - Z1) / 3) + eye(PHASES) * Z1
+    else:
+        Z = eye(PHASES) * complex(line['R'], line['X'])
+
+    if 'B_matrix' in line:
+        B = array(line['B_matrix'], dtype = float)
+    else:
+        B = eye(PHASES) * line.get('B', 0)
+
+    return Z, B
+
+
+class ThreePhaseGrid:
+    # Unbalanced three-phase grid, with the interface of SinglePhaseGrid.
+    # Every line has 3x3 series impedance and shunt susceptance matrices (see
+    # line_matrices), and the admittance matrix is assembled from these
+    # blocks, with the three phases of bus i at the indices 3i, 3i+1, 3i+2.
+    #
+    # The base quantities are the line-to-line voltage and three-phase power,
+    # as in SinglePhaseGrid, so that a balanced grid gives the same per-phase
+    # results.  Voltages are phase-to-neutral and powers are per phase: the
+    # power of a PQ bus is either a number, split equally between the phases,
+    # or a list with the power of every phase.  The slack voltage is the
+    # line-to-line voltage of phase 1 (the other phases are rotated by
+    # PHASE_ROTATION).
+    #
+    # The load flow is the Z-bus (fixed-point) iteration of SinglePhaseGrid
+    # on all phases at once, with the sparse LU factors of the 3(n-1) x
+    # 3(n-1) matrix Yll, so that ALG is 'CW', 'SCW' or 'auto'.  The tolerance
+    # settings, the iteration limit and the divergence stop are those of
+    # SinglePhaseGrid; the approximate mode and the compiled-grid cache are
+    # not supported.
+    def __init__(self, data, ALG = 'CW', voltage_tolerance = VOLTAGE_TOLERANCE, api_path = None,
+                 tolerance_mode = 'absolute', max_iter = MAX_ITER, warm_start = True,
+                 approximate = False, approximation_tolerance = 1e-6, cache_path = None):
+        if ALG not in ('CW', 'SCW', 'auto'):
+            raise ValueError("The three-phase grid only supports the CW algorithm, not {}".format(ALG))
+        if approximate or cache_path is not None:
+            raise ValueError("The three-phase grid does not support the approximate mode or the cache")
+
+        self.lines = tuple((line['from'], line['to']) + line_matrices(line) for line in data['lines'])
+        self.no_lines = len(self.lines)
+        self.no_buses = max(self.lines, key = itemgetter(1))[1] + 1 # +1 because the bus indices start from 0
+
+        self.baseV = data['base_quantities']['V']
+        self.baseS = data['base_quantities']['S']
+        self.Ybase = self.baseS / (self.baseV * self.baseV)
+        # Per-phase base current.
+        self.Ibase = self.baseS / (sqrt(3) * self.baseV)
+
+        self.tolerance = voltage_tolerance
+        if tolerance_mode not in ('absolute', 'relative'):
+            raise ValueError("Unknown tolerance mode: {}".format(tolerance_mode))
+        self.tolerance_mode = tolerance_mode
+        self.max_iter = max_iter
+        self.warm_start = warm_start
+        self.algorithm = 'SCW' if ALG == 'auto' else ALG
+        self.calibration = None
+        self.approximate = False
+
+        # Outcome of the last load flow.
+        self.iterations = 0
+        self.residual = inf
+        self.converged = False
+        self.approximated = False
+
+        # Slack power and currents of the solution, computed on first access,
+        # as for the single-phase grid.
+        self.version = 0
+        self.__derived = {}
+
+        # Outcome and timings of the last load flows, as for the single-phase
+        # grid.
+        self.solves = deque(maxlen = SOLVE_HISTORY)
+
+        #Compute the admittance matrix.
+        self.__admittance_matrix()
+        self.__puYl0 = self.__puY[PHASES:, :PHASES].toarray()
+        self.__puYllLU = splu(self.__puY[PHASES:, PHASES:].tocsc())
+        # Voltages of the PQ buses at no load, for a unit slack voltage.
+        self.__puWunit = - self.__puYllLU.solve(self.__puYl0 @ PHASE_ROTATION.reshape(PHASES, 1)).ravel()
+
+        if api_path is not None:
+            from snippets import load_api, dump_api
+            api = load_api(api_path, check_readiness = False)
+            api.base_quantities = data['base_quantities']
+            dump_api(api, api_path)
+
+
+    def __admittance_matrix(self):
+        # Assemble Y from the 3x3 blocks of the lines, in p.u.
+        self.__lineFrom = array([line[0] for line in self.lines])
+        self.__lineTo = array([line[1] for line in self.lines])
+
+        self.__puYline = inv(array([line[2] for line in self.lines])) / self.Ybase
+        self.__puBline = 1j * array([line[3] for line in self.lines]) / self.Ybase / 2
+
+        # Row and column indices of the blocks at (from, from), (to, to),
+        # (from, to) and (to, from).
+        phase = arange(PHASES)
+        blocks = ((self.__lineFrom, self.__lineFrom), (self.__lineTo, self.__lineTo),
+                  (self.__lineFrom, self.__lineTo), (self.__lineTo, self.__lineFrom))
+        shape = (self.no_lines, PHASES, PHASES)
+        rows = concatenate([broadcast_to((PHASES * a)[:, None, None] + phase[None, :, None], shape).ravel()
+                            for a, _ in blocks])
+        cols = concatenate([broadcast_to((PHASES * b)[:, None, None] + phase[None, None, :], shape).ravel()
+                            for _, b in blocks])
+        values = concatenate([(self.__puYline + self.__puBline).ravel(), (self.__puYline + self.__puBline).ravel(),
+                              - self.__puYline.ravel(), - self.__puYline.ravel()])
+
+        # Duplicate entries are summed up when converting to CSR.
+        self.__puY = coo_matrix((values, (rows, cols)),
+                                shape = (PHASES * self.no_buses, PHASES * self.no_buses)).tocsr()
+
+
+    def __phasePowers(self, values):
+        # Power of every phase of the PQ buses, shape (no_buses - 1, 3).
+        return array([value if isinstance(value, (list, tuple)) else [value / PHASES] * PHASES
+                      for value in values], dtype = float)
+
+
+    def __hasConverged(self, deltaV, V):
+        residual = norm(deltaV, inf)
+        previous = self.residual
+        self.__increases = self.__increases + 1 if residual > previous else 0
+        self.residual = residual
+        # The residual is within the tolerance, or stopped decreasing at the
+        # noise floor.
+        scale = norm(V, inf)
+        if residual >= previous and residual <= NOISE_FLOOR * scale:
+            return True
+        if self.tolerance_mode == 'relative':
+            return residual <= self.tolerance * scale
+        return residual <= self.tolerance
+
+
+    def __diverging(self):
+        # Whether the residual is not finite, or increased at the last
+        # DIVERGENCE_ITERATIONS iterations.
+        return self.iterations > 0 and (not isfinite(self.residual) or
+                                        self.__increases >= DIVERGENCE_ITERATIONS)
+
+
+    def __solveCW(self):
+        self.iterations = 0
+        self.residual = inf
+        self.__increases = 0
+        self.converged = False
+        while (self.max_iter is None or self.iterations < self.max_iter) and not self.__diverging():
+            self.iterations += 1
+            puVkplus1 = self.__puYllLU.solve(conjugate(self.__puS / self.__puVk)) + self.__puW
+            deltaVpu = puVkplus1 - self.__puVk
+            self.__puVk = puVkplus1
+            if self.__hasConverged(deltaVpu, self.__puVk):
+                self.converged = True
+                break
+
+
+    def update(self, listP, listQ, slackVR, slackVX):
+        start = timer()
+        # Warm start only from a converged solution.
+        warm = self.warm_start and self.converged
+
+        P = self.__phasePowers(listP)
+        Q = self.__phasePowers(listQ)
+        self.pqBusesP = P.tolist()
+        self.pqBusesQ = Q.tolist()
+        self.__slackV = complex(slackVR, slackVX)
+
+        # Per-phase base power is baseS / 3.
+        self.__puS = (P + 1j * Q).ravel() * PHASES / self.baseS
+        puV0 = self.__slackV / self.baseV
+        puW = self.__puWunit * puV0
+
+        # W is linear in the slack voltage, so shift the previous solution by
+        # the change of W.
+        if warm:
+            self.__puVk = self.__puVk + puW - self.__puW
+        else:
+            self.__puVk = puW
+        self.__puW = puW
+        iterationStart = timer()
+        self.__solveCW()
+        iterationEnd = timer()
+
+        self.__puV = concatenate((puV0 * PHASE_ROTATION, self.__puVk))
+        V = self.__puV.reshape(self.no_buses, PHASES) * self.baseV / sqrt(3)
+        self.realV = V.real
+        self.imagV = V.imag
+        self.version += 1
+        self.__derived.clear()
+
+        self.solves.append({
+            'version': self.version,
+            'algorithm': self.algorithm,
+            'incremental': False,
+            'approximated': False,
+            'iterations': self.iterations,
+            'residual': float(self.residual),
+            'converged': self.converged,
+            'assembly': iterationStart - start,
+            'iteration': iterationEnd - iterationStart,
+            'postprocessing': timer() - iterationEnd
+        })
+
+        return self.iterations
+
+
+    def updatebus(self, index, newP, newQ):
+        return self.updatebuses([index], [newP], [newQ])
+
+
+    def updatebuses(self, indices, listP, listQ, slackVR = None, slackVX = None):
+        # The other buses keep their power, and the load flow is warm-started
+        # from the last solution.
+        P = list(self.pqBusesP)
+        Q = list(self.pqBusesQ)
+        for index, newP, newQ in zip(indices, listP, listQ):
+            P[index - 1] = newP
+            Q[index - 1] = newQ
+        if slackVR is None:
+            slackVR, slackVX = self.__slackV.real, self.__slackV.imag
+
+        return self.update(P, Q, slackVR, slackVX)
+
+
+    def set_solution(self, realV, imagV, pqBusesP, pqBusesQ):
+        # Solution of a load flow solved by another instance of the grid, from
+        # which the derived quantities are computed, as for SinglePhaseGrid.
+        self.realV = asarray(realV)
+        self.imagV = asarray(imagV)
+        self.pqBusesP = pqBusesP
+        self.pqBusesQ = pqBusesQ
+        self.__puV = (self.realV + 1j * self.imagV).ravel() * sqrt(3) / self.baseV
+        self.version += 1
+        self.__derived.clear()
+
+
+    def computeSlackPower(self):
+        # Power of every phase of the slack bus.
+        puV0 = self.__puV[:PHASES]
+        S = puV0 * conjugate(self.__puY[:PHASES] @ self.__puV) * self.baseS / PHASES
+        self.__derived['slackPower'] = (S.real, S.imag)
+
+
+    def computeCurrents(self):
+        # Currents of every phase, in A.
+        V = self.__puV.reshape(self.no_buses, PHASES)
+        self.__derived['busCurrents'] = (self.__puY @ self.__puV).reshape(self.no_buses, PHASES) * self.Ibase
+
+        Vfrom = V[self.__lineFrom]
+        Vto = V[self.__lineTo]
+        self.__derived['forwardCurrents'] = (einsum('lij,lj->li', self.__puYline, Vfrom - Vto) +
+                                             einsum('lij,lj->li', self.__puBline, Vfrom)) * self.Ibase
+        self.__derived['backwardCurrents'] = (einsum('lij,lj->li', self.__puYline, Vto - Vfrom) +
+                                              einsum('lij,lj->li', self.__puBline, Vto)) * self.Ibase
+
+
+    def __derive(self, key, compute):
+        # Quantity derived from the solution, computed on first access.
+        if key not in self.__derived:
+            start = timer()
+            compute()
+            if self.solves and self.solves[-1]['version'] == self.version:
+                self.solves[-1]['postprocessing'] += timer() - start
+        return self.__derived[key]
+
+
+    @property
+    def slackPower(self):
+        return self.__derive('slackPower', self.computeSlackPower)
+
+
+    @property
+    def busCurrents(self):
+        return self.__derive('busCurrents', self.computeCurrents)
+
+
+    @property
+    def forwardCurrents(self):
+        return self.__derive('forwardCurrents', self.computeCurrents)
+
+
+    @property
+    def backwardCurrents(self):
+        return self.__derive('backwardCurrents', self.computeCurrents)
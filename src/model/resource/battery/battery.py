@@ -209,6 +209,7 @@ def main():
 
     # Extract configuration information.
     bus_index = config['bus_index']
+    phase = config.get('phase')  # Phase of a three-phase grid, if any.
     listen_addr = '127.0.0.1', config['listen_port']
     reply_addr = config['RA']['ip'], config['RA']['listen_port']
     log_path = config['log_path']
@@ -276,7 +277,7 @@ def main():
                     .format(battery.P, battery.Q))
 
         if battery.P != lastImplementedP or battery.Q != lastImplementedQ:
-            api.implement_setpoint(bus_index, battery.P, battery.Q)
+            api.implement_setpoint(bus_index, battery.P, battery.Q, phase)
             lastImplementedP = battery.P
             lastImplementedQ = battery.Q
 
@@ -227,7 +227,7 @@ def listen_from_csa(listen_addr):
             lock.release()
 
 
-def update_and_send_measurements(bus_index, api, reply_addr, arriv_depart_addr):
+def update_and_send_measurements(bus_index, api, reply_addr, arriv_depart_addr, phase=None):
     global occupied_slots
 
     while True:
@@ -287,7 +287,7 @@ def update_and_send_measurements(bus_index, api, reply_addr, arriv_depart_addr):
         print ('DEBUG: measurement update is sent to CSA.')
 
         # Send the new state to the Grid model
-        api.implement_setpoint(bus_index, total_P, 0) # Basically, it's the power demand (that's why, load is positive)
+        api.implement_setpoint(bus_index, total_P, 0, phase) # Basically, it's the power demand (that's why, load is positive)
         print ('DEBUG: Sent total CS Pd = {}, and Qd = {}, to Grid Module.'.format(total_P, 0))
 
         elapsed_time = default_timer() - start_time
@@ -326,6 +326,7 @@ def main():
 
     # Extract some relevant things out of the configuration.
     bus_index = config['bus_index']
+    phase = config.get('phase')  # Phase of a three-phase grid, if any.
     listen_addr = api.grid_ip, config['port']
     #listen_addr = '127.0.0.1', config['port']
     reply_addr = config['RA']['ip'], config['RA']['port']
@@ -339,7 +340,7 @@ def main():
 
     print ("DEBUG: Starting a new thread to periodically update implemented setpoint for each EV and send them to CSA...".format())
     # Run the thread to periodically update implemented setpoint for each EV and send them to CSA...
-    Thread(target=update_and_send_measurements, args=(bus_index, api, reply_addr, arriv_depart_addr, )).start()
+    Thread(target=update_and_send_measurements, args=(bus_index, api, reply_addr, arriv_depart_addr, phase, )).start()
 
 
     if SIMULATION_FROM_ONE_DAY_ARRIVAL_TRACE == True:
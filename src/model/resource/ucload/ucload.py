@@ -150,6 +150,7 @@ def main():
 
     # Extract some relevant things out of the configuration.
     bus_index = config['bus_index']
+    phase = config.get('phase')  # Phase of a three-phase grid, if any.
     load_path = config['trace_file_abs_path']
 
     # "labview" : message format for 'old' labview resource-agent executabée
@@ -207,7 +208,7 @@ def main():
         state['Q'] = S * sqrt(1 - (POWER_FACTOR * POWER_FACTOR))
         logger.info("Implementing setpoint at index {}, (Pd = {}, Qd = {})"
                     .format(bus_index, state['P'], state['Q']))
-        api.implement_setpoint(bus_index, state['P'], state['Q'])
+        api.implement_setpoint(bus_index, state['P'], state['Q'], phase)
         queue.put(state)
         elapsed_time = default_timer() - start_time
         if elapsed_time < sample_period:
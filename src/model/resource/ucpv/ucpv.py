@@ -137,6 +137,7 @@ def main():
 
     # Extract some relevant things out of the configuration.
     bus_index = config['bus_index']
+    phase = config.get('phase')  # Phase of a three-phase grid, if any.
     irradiance_path = config['irradiance_trace_file_path']
 
     ucpv_ra_addr = config['RA']['ip'], config['RA']['listen_port']
@@ -196,7 +197,7 @@ def main():
         logger.info("Implementing setpoint at index {}, (Pd = {}, Qd = {})"
                     .format(ptr_ID, state['P'], state['Q']))
 
-        api.implement_setpoint(bus_index, state['P'], state['Q'])
+        api.implement_setpoint(bus_index, state['P'], state['Q'], phase)
 
         state['Ts'] = datetime.now()
         state_queue.put(state)
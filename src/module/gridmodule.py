@@ -24,16 +24,23 @@
 # SOFTWARE.
 
 from argparse import ArgumentParser
+from asyncio import DatagramProtocol, new_event_loop
+from collections import deque
 from csv import DictWriter
 from logging import basicConfig, getLogger, INFO
-from os import path
+from os import path, set_blocking
 from socket import socket, AF_INET, SOCK_DGRAM
 from sys import stdout, exit, exc_info
-from numpy import maximum, absolute, angle
-from datetime import datetime
-from gridapi import GridAPI
-from multiprocessing import Process, Manager
+from numpy import maximum, absolute, angle, asarray, concatenate, array, full, \
+    argwhere, inf, sqrt, mean, percentile
+from datetime import datetime, timedelta
+from gridapi import GridAPI, SUBSCRIPTION_LEASE
+from multiprocessing import Process, Queue, Event, Pipe
+from queue import Empty
+from select import select
+from sharedstate import SharedState, SetpointBuffer
 from singlephasegrid import SinglePhaseGrid
+from threephasegrid import ThreePhaseGrid, PHASES
 from snippets import load_json_file, load_json_data, dump_json_data, \
     dump_api
 from timeit import default_timer as timer
@@ -45,92 +52,452 @@ logger = getLogger('grid.module')
 
 
 BUFFER_LIMIT = 20000
+INCREMENTAL_FRACTION = 0.1  # Largest fraction of updated buses for an incremental LF.
+COALESCING_WINDOW = 0  # Time (in milli seconds) during which setpoints are gathered for one LF.
+METRICS_HISTORY = 1000  # Number of LFs whose metrics are kept for the clients.
+METRICS_REPLY = 20  # Default number of LFs whose metrics are sent to a client.
+FRONTEND = 'blocking'  # Default front end that receives the messages: 'blocking' or 'asyncio'.
 
+# Metrics of every LF, as recorded in the solve history of the grid: outcome
+# of the solver, and time (in seconds) spent in assembly, iteration and
+# post-processing.
+METRICS_FIELDS = ('version', 'algorithm', 'incremental', 'approximated', 'iterations', 'residual',
+                  'converged', 'assembly', 'iteration', 'postprocessing')
 
-def extract_state(grid):
+# Columns of the violation events: start or end of a violation, with the
+# value (the worst one for an end) and the duration (in seconds) of the
+# violation.
+VIOLATION_FIELDS = ('Timestamp', 'Event', 'Type', 'Index', 'Value', 'Limit', 'Duration')
+
+# Grid models, selected by the 'model' entry of the grid configuration.
+GRID_MODELS = {
+    'singlephase': SinglePhaseGrid,
+    'threephase': ThreePhaseGrid
+}
+
+
+def solver_kwargs(grid_config):
+    """Read the load-flow solver settings from the grid configuration.
+
+    Parameters
+    ----------
+        grid_config : dict
+            The `grid` section of the grid configuration file.
+
+    Returns
+    -------
+        kwargs : dict
+            Keyword arguments for the grid model.  Settings that are not in
+            the configuration are left to the defaults of the grid model.
+
+    """
+    solver = grid_config.get('solver', {})
+    kwargs = {}
+    for key, kwarg in (('algorithm', 'ALG'),
+                       ('voltage_tolerance', 'voltage_tolerance'),
+                       ('tolerance_mode', 'tolerance_mode'),
+                       ('max_iter', 'max_iter'),
+                       ('warm_start', 'warm_start'),
+                       ('approximate', 'approximate'),
+                       ('approximation_tolerance', 'approximation_tolerance'),
+                       ('cache_path', 'cache_path')):
+        if key in solver:
+            kwargs[kwarg] = solver[key]
+
+    return kwargs
+
+
+def _bus_powers(slack, pq):
+    # Power of all the buses, the slack bus first.
+    return concatenate((asarray(slack)[None], asarray(pq)))
+
+
+# Fields of the state, and how to derive them from a grid.  The quantities of
+# the grid are computed on first access for every solution, so that only the
+# fields that are extracted are computed.
+STATE_FIELDS = {
+    'P': lambda grid: _bus_powers(grid.slackPower[0], grid.pqBusesP),
+    'Q': lambda grid: _bus_powers(grid.slackPower[1], grid.pqBusesQ),
+    # Magnitude and angle (degrees) of the voltages.
+    'Vm': lambda grid: absolute(grid.realV + 1j * grid.imagV),
+    'Va': lambda grid: angle(grid.realV + 1j * grid.imagV, deg=True),
+    'LineCurrents': lambda grid: maximum(absolute(grid.forwardCurrents), absolute(grid.backwardCurrents))
+}
+
+
+def extract_state(grid, fields=tuple(STATE_FIELDS)):
     """Extract the state from a grid.
 
     Parameters
     ----------
-        grid : SinglePhaseGrid
+        grid : SinglePhaseGrid or ThreePhaseGrid
             Grid to extract the state from.
 
+        fields : iterable of str (optional, default all fields)
+            Fields of the state to extract, among `STATE_FIELDS`.
+
     Returns
     -------
         state : dict
-            State of the grid after negating the "demand" values.
+            State of the grid after negating the "demand" values, as NumPy
+            arrays with one entry per bus or line.  For a three-phase grid,
+            every array has one column per phase.
 
     """
-    grid.computeSlackPower()
-    listP = [p for p in grid.pqBusesP]
-    listP.insert(0, grid.slackPower[0])
-    listQ = [q for q in grid.pqBusesQ]
-    listQ.insert(0, grid.slackPower[1])
-
-    grid.computeCurrents()
-    lineCurrents = maximum(absolute(grid.forwardCurrents), absolute(grid.backwardCurrents)).tolist()
-
-    # convert real and imaginary to magnitude and angle (degrees)
-    Vm = []
-    Va = []
-    for i in range(len(grid.realV)):
-        complexVoltage = complex(grid.realV[i], grid.imagV[i])
-        Vm.append(absolute(complexVoltage))
-        Va.append(angle(complexVoltage, deg=True))
+    return {field: STATE_FIELDS[field](grid) for field in fields}
 
-    return {
-        'P': listP,
-        'Q': listQ,
-        'Vm': Vm,
-        'Va': Va,
-        'LineCurrents': lineCurrents
-    }
 
+def state_shapes(grid_config, fields=tuple(STATE_FIELDS)):
+    """Shapes of the fields of the state of a grid, as extracted by `extract_state`.
+
+    Parameters
+    ----------
+        grid_config : dict
+            The `grid` section of the grid configuration file.
+
+        fields : iterable of str (optional, default all fields)
+            Fields of the state, among `STATE_FIELDS`.
+
+    Returns
+    -------
+        shapes : dict
+            Shape of every field.
+
+    """
+    no_lines = len(grid_config['lines'])
+    no_buses = max(line['to'] for line in grid_config['lines']) + 1  # +1 because the bus indices start from 0
+    phases = (PHASES,) if grid_config.get('model') == 'threephase' else ()
+    return {field: ((no_lines,) if field == 'LineCurrents' else (no_buses,)) + phases for field in fields}
+
+
+# Limits that are monitored, as (type, field of the state, sign).  The sign
+# is -1 for lower limits, so that every limit is violated when the signed
+# value exceeds the signed limit.
+VIOLATION_TYPES = (('overload', 'LineCurrents', 1),
+                   ('undervoltage', 'Vm', -1),
+                   ('overvoltage', 'Vm', 1))
+
+
+class ViolationMonitor():
+    """Monitor of the line ampacities and the voltage bands of a grid.
+
+    The limits are read from the grid configuration: the optional `ampacity`
+    (in A) of every line, the `voltage_limits` (in p.u.) of all the buses and
+    the `bus_voltage_limits` that override them for some buses.  Limits that
+    are not given are never violated.
+
+    The ampacity is compared with the phase current.  In the single-phase
+    model, the line currents are computed from the line-to-line voltages,
+    i.e., they are sqrt(3) times the phase current, and are scaled back
+    before the comparison, so that the overload events report phase
+    currents in both models.
+
+    Every state is compared at once with all the limits, and only the start
+    and the end of every violation are reported as events.
+
+    """
+
+    def __init__(self, grid_config, no_buses, no_lines, three_phase=False):
+        """Read the limits from the grid configuration.
+
+        Parameters
+        ----------
+            grid_config : dict
+                The `grid` section of the grid configuration file.
+
+            no_buses : int
+                Number of buses of the grid.
+
+            no_lines : int
+                Number of lines of the grid.
+
+            three_phase : bool (optional, default False)
+                Whether the states are those of a three-phase grid, with one
+                column per phase and phase-to-neutral voltages.
+
+        Raises
+        ------
+            error : ValueError
+                A limit is given for a bus that is not in the grid.
+
+        """
+        self.three_phase = three_phase
+
+        # Voltage limits in V, as the magnitudes of the states.
+        Vbase = grid_config['base_quantities']['V'] / (sqrt(3) if three_phase else 1)
+        voltage_limits = grid_config.get('voltage_limits', {})
+        Vmin = full(no_buses, voltage_limits.get('min', -inf), dtype=float)
+        Vmax = full(no_buses, voltage_limits.get('max', inf), dtype=float)
+        for limits in grid_config.get('bus_voltage_limits', []):
+            bus = int(limits['bus'])
+            if not 0 <= bus < no_buses:
+                raise ValueError("Voltage limits of an unknown bus: {}".format(bus))
+            Vmin[bus] = limits.get('min', Vmin[bus])
+            Vmax[bus] = limits.get('max', Vmax[bus])
+
+        ampacity = array([line.get('ampacity', inf) for line in grid_config['lines']], dtype=float)
+        assert len(ampacity) == no_lines
+
+        limits = {'overload': ampacity, 'undervoltage': Vmin * Vbase, 'overvoltage': Vmax * Vbase}
+        # Factor from the fields of the states to the quantities of the limits.
+        scales = {'overload': 1 if three_phase else 1 / sqrt(3), 'undervoltage': 1, 'overvoltage': 1}
+
+        # For every type of violation, the signed limits (one column per
+        # phase, if any), and the start and the worst signed value of the
+        # ongoing violations.
+        self.__violations = []
+        for type_, field, sign in VIOLATION_TYPES:
+            limit = sign * limits[type_]
+            if three_phase:
+                limit = limit.repeat(PHASES).reshape(-1, PHASES)
+            self.__violations.append({
+                'type': type_,
+                'field': field,
+                'sign': sign,
+                'scale': scales[type_],
+                'limit': limit,
+                'active': full(limit.shape, False),
+                'start': full(limit.shape, None, dtype=object),
+                'worst': full(limit.shape, -inf)
+            })
+
+    @property
+    def active(self):
+        """Number of ongoing violations of every type."""
+        return {violation['type']: int(violation['active'].sum()) for violation in self.__violations}
+
+    def check(self, state, timestamp):
+        """Compare a state with the limits.
+
+        Parameters
+        ----------
+            state : dict
+                State of the grid, as returned by `extract_state`, with the
+                fields 'LineCurrents' and 'Vm'.
+
+            timestamp : datetime or float
+                Time of the state.
+
+        Returns
+        -------
+            events : list of dict
+                Violations that started or ended with this state.  A 'start'
+                event has the 'Value' of the state, and an 'end' event has
+                the worst 'Value' of the violation and its 'Duration' (in
+                seconds).
+
+        """
+        events = []
+        for violation in self.__violations:
+            value = violation['sign'] * violation['scale'] * asarray(state[violation['field']])
+            violated = value > violation['limit']
+            active = violation['active']
+            if not (violated.any() or active.any()):
+                continue
+
+            started = violated & ~active
+            ended = active & ~violated
+            worst = violation['worst']
+            worst[violated] = maximum(worst[violated], value[violated])
+
+            for index in argwhere(ended):
+                index = tuple(index)
+                duration = timestamp - violation['start'][index]
+                events.append(self.__event(violation, 'end', index, timestamp, worst[index],
+                                           duration.total_seconds() if isinstance(duration, timedelta)
+                                           else duration))
+            for index in argwhere(started):
+                index = tuple(index)
+                events.append(self.__event(violation, 'start', index, timestamp, value[index]))
+
+            violation['start'][started] = timestamp
+            violation['start'][ended] = None
+            worst[ended] = -inf
+            violation['active'] = violated
+
+        return events
+
+    def __event(self, violation, event, index, timestamp, value, duration=None):
+        # Event of a violation, with the values in their original sign.
+        row = {
+            'Timestamp': timestamp,
+            'Event': event,
+            'Type': violation['type'],
+            'Index': int(index[0]),
+            'Value': float(violation['sign'] * value),
+            'Limit': float(violation['sign'] * violation['limit'][index]),
+            'Duration': duration
+        }
+        if self.three_phase:
+            row['PhaseIndex'] = int(index[1]) + 1
+        return row
+
+
+class ReplyCache():
+    """Encoded replies to the requests for the state of the grid.
+
+    The replies are encoded once for every published state and set of
+    requested fields, and the same bytes are sent to all the requests until
+    a new state is published.
+
+    """
+
+    def __init__(self, state):
+        """Create an empty cache.
+
+        Parameters
+        ----------
+            state : SharedState
+                Shared state from which to read the published state.
+
+        """
+        self.__state = state
+        self.__sequence = None
+        self.__replies = {}
+
+    @property
+    def sequence(self):
+        """Sequence number of the state of the cached replies."""
+        return self.__sequence
+
+    def reply(self, fields=None):
+        """Reply to a request.
+
+        Parameters
+        ----------
+            fields : iterable of str (optional, default all fields)
+                Requested fields of the state.
+
+        Returns
+        -------
+            reply : bytes
+                Encoded fields of the last published state.
+
+        Raises
+        ------
+            error : KeyError
+                A field is not published.
+
+        """
+        key = None if fields is None else tuple(fields)
+        if self.__state.sequence != self.__sequence:
+            self.__sequence, self.__replies = self.__state.sequence, {}
+
+        if key not in self.__replies:
+            sequence, state = self.__state.read(key)
+            if sequence != self.__sequence:
+                # A new state was published in the meantime.
+                self.__sequence, self.__replies = sequence, {}
+            self.__replies[key] = dump_json_data(state)
+
+        return self.__replies[key]
 
-def log_generator(state_queue, log_path):
+
+def log_generator(state_queue, log_path, grid_config, monitor):
     """Write logs to CSV files, and update it whenever the state is changed.
 
+    The state is derived from the raw solution of every LF in an instance of
+    the grid of this process, so that the LF process does not compute the
+    fields that are only logged.
+
     Parameters
     ----------
         state_queue : multiprocessing.Queue
-            Queue where the state should be put.
+            Queue where the raw solutions should be put.
 
         log_path : path_like
             Relative path to which to write the bus and line log.
 
+        grid_config : dict
+            The `grid` section of the grid configuration file.  The states of
+            a three-phase grid are logged with one row per phase.
+
+        monitor : ViolationMonitor
+            Monitor with which to check the limits of the grid.  The
+            violations are logged along with the state.
+
 
     """
+    three_phase = grid_config.get('model') == 'threephase'
+    grid = GRID_MODELS[grid_config.get('model', 'singlephase')](grid_config, ALG='SCW')
+
     log_path_bus = path.join(log_path, 'grid_bus.csv')
     log_path_line = path.join(log_path, 'grid_line.csv')
+    log_path_metrics = path.join(log_path, 'grid_metrics.csv')
+    log_path_violations = path.join(log_path, 'grid_violations.csv')
 
     log_file_bus = open(log_path_bus, 'w', buffering=1, newline='')
     log_writer_bus = DictWriter(
-        log_file_bus, ('Timestamp','BusIndex', 'P', 'Q', 'Vm', 'Va')
+        log_file_bus, ('Timestamp','BusIndex', 'PhaseIndex', 'P', 'Q', 'Vm', 'Va') if three_phase
+        else ('Timestamp','BusIndex', 'P', 'Q', 'Vm', 'Va')
     )
     log_writer_bus.writeheader()
 
     log_file_line = open(log_path_line, 'w', buffering=1, newline='')
     log_writer_line = DictWriter(
-        log_file_line, ('Timestamp', 'Line #', 'LineCurrent')
+        log_file_line, ('Timestamp', 'Line #', 'PhaseIndex', 'LineCurrent') if three_phase
+        else ('Timestamp', 'Line #', 'LineCurrent')
     )
     log_writer_line.writeheader()
 
+    log_file_metrics = open(log_path_metrics, 'w', buffering=1, newline='')
+    log_writer_metrics = DictWriter(log_file_metrics, ('Timestamp',) + METRICS_FIELDS)
+    log_writer_metrics.writeheader()
+
+    log_file_violations = open(log_path_violations, 'w', buffering=1, newline='')
+    log_writer_violations = DictWriter(
+        log_file_violations, VIOLATION_FIELDS[:4] + ('PhaseIndex',) + VIOLATION_FIELDS[4:] if three_phase
+        else VIOLATION_FIELDS
+    )
+    log_writer_violations.writeheader()
+
     while True:
-        # Retrieve the state from the queue.
-        state = state_queue.get()
+        # Retrieve the solution from the queue, and derive the state, with
+        # lists instead of arrays.
+        message = state_queue.get()
+        load_solution(grid, message['Solution'])
+        state = extract_state(grid)
+        violations = monitor.check(state, message['Ts'])
+        for event in violations:
+            if event['Event'] == 'start':
+                logger.warning("Violation: {Type} at index {Index} ({Value} for a limit of {Limit})".format(**event))
+        state = {key: value.tolist() for key, value in state.items()}
+        state['Ts'] = message['Ts']
+        state['Solve'] = message['Solve']
+        state['Violations'] = violations
         assert len({
             len(state['P']), len(state['Q']),
             len(state['Vm']), len(state['Va'])
         }) == 1
 
+        # Write the metrics of the LF.
+        if 'Solve' in state:
+            row = {'Timestamp': state['Ts']}
+            row.update(state['Solve'])
+            log_writer_metrics.writerow(row)
+
+        # Write the violations that started or ended with this state.
+        log_writer_violations.writerows(state.get('Violations', []))
+
         row = {'Timestamp': state['Ts']}
 
         for index, (P, Q, Vm, Va) in enumerate(
                 zip(state['P'], state['Q'], state['Vm'], state['Va'])
         ):
             # Write the state of the current bus.
+            row['BusIndex'] = index
+            if three_phase:
+                for phase_index, (P_phase, Q_phase, Vm_phase, Va_phase) in enumerate(zip(P, Q, Vm, Va), 1):
+                    row.update({
+                        'PhaseIndex': phase_index,
+                        'P': P_phase,
+                        'Q': Q_phase,
+                        'Vm': Vm_phase,
+                        'Va': Va_phase
+                    })
+                    log_writer_bus.writerow(row)
+                continue
             row.update({
-                'BusIndex': index,
                 'P': P,
                 'Q': Q,
                 'Vm': Vm,
@@ -144,29 +511,174 @@ def log_generator(state_queue, log_path):
                 (state['LineCurrents'])
         ):
             # Write the state of the current line.
-            row.update({
-                'Line #': index,
-                'LineCurrent': LineCurrent
-            })
+            row['Line #'] = index
+            if three_phase:
+                for phase_index, LineCurrent_phase in enumerate(LineCurrent, 1):
+                    row.update({
+                        'PhaseIndex': phase_index,
+                        'LineCurrent': LineCurrent_phase
+                    })
+                    log_writer_line.writerow(row)
+                continue
+            row['LineCurrent'] = LineCurrent
             log_writer_line.writerow(row)
 
     log_writer_bus.close()
     log_writer_line.close()
+    log_writer_metrics.close()
+    log_writer_violations.close()
+
+
+def switch_line(grid, message):
+    """Open or close a line of the grid as requested by a message.
+
+    Parameters
+    ----------
+        grid : SinglePhaseGrid or ThreePhaseGrid
+            Grid in which to switch the line.
+
+        message : dict
+            Message of type `switch_line`, with the index of the line and
+            whether to close it.
+
+    Returns
+    -------
+        switched : bool
+            Whether the topology changed, i.e., False if the switch failed
+            or the line was already in the requested state.
+
+    """
+    if not isinstance(grid, SinglePhaseGrid):
+        logger.error("Lines cannot be switched in a three-phase grid")
+        return False
+
+    try:
+        switched = grid.switch_line(int(message['line']), bool(message['closed']))
+    except ValueError as e:
+        logger.error("Could not switch line {}: {}".format(message['line'], e))
+        return False
+    if not switched:
+        logger.info("Line {} already {}".format(message['line'], "closed" if message['closed'] else "open"))
+        return False
 
+    logger.info("Line {} {}, open lines: {}".format(
+        message['line'], "closed" if message['closed'] else "opened", grid.open_lines))
+    return True
 
-def update_handler(state, message_queue, state_queue, *args, **kwargs):
-    """Handle messages that update the grid, i.e., implement a setpoint.
+
+def solution(grid):
+    """Raw solution of the last load flow of a grid.
+
+    Parameters
+    ----------
+        grid : SinglePhaseGrid or ThreePhaseGrid
+            Grid to take the solution from.
+
+    Returns
+    -------
+        solution : dict
+            Voltages, power of the PQ buses and open lines, from which
+            `load_solution` derives the state in another instance of the grid.
+
+    """
+    return {
+        'realV': grid.realV,
+        'imagV': grid.imagV,
+        'P': asarray(grid.pqBusesP, dtype=float),
+        'Q': asarray(grid.pqBusesQ, dtype=float),
+        'open_lines': grid.open_lines if isinstance(grid, SinglePhaseGrid) else ()
+    }
+
+
+def load_solution(grid, solution):
+    """Set the raw solution of another instance of a grid, as returned by `solution`.
+
+    Parameters
+    ----------
+        grid : SinglePhaseGrid or ThreePhaseGrid
+            Grid in which to set the solution.  The lines are switched to the
+            topology of the solution.
+
+        solution : dict
+            Raw solution of the grid.
+
+    """
+    if isinstance(grid, SinglePhaseGrid):
+        for line in set(grid.open_lines) ^ set(solution['open_lines']):
+            grid.switch_line(line, line in grid.open_lines)
+    grid.set_solution(solution['realV'], solution['imagV'], solution['P'], solution['Q'])
+
+
+def publish(grid, state, published, state_queue, solves, fields):
+    """Publish the state of the grid after a load flow.
+
+    The published fields are extracted first and the front end is notified
+    at once.  Only the raw solution is put in the queue of the logs, which
+    derive the other fields and check the limits outside of the LF process.
 
     Parameters
     ----------
-        state : multiprocessing.manager.dict
-            Shared dict that stores the state of the grid.
+        grid : SinglePhaseGrid or ThreePhaseGrid
+            Grid to extract the state from.
 
-        message_queue : multiprocessing.manager.Queue
-            Queue in which the main process stores messages.
+        state : SharedState
+            Shared state in which to publish the state.
 
-        state_queue : multiprocessing.manager.Queue
-            Queue in which the updated state will be put.
+        published : multiprocessing.connection.Connection
+            Non-blocking connection on which to notify the front end.
+
+        state_queue : multiprocessing.Queue
+            Queue in which the raw solution, with the metrics of the LF, will
+            be put for the logs.
+
+        solves : multiprocessing.Queue
+            Queue in which the metrics of the LF will be put for the clients.
+
+        fields : iterable of str
+            Fields of the state to publish, i.e., those of the shared state.
+
+    """
+    state.write(extract_state(grid, fields))
+    notify(published)
+
+    state_queue.put({'Ts': datetime.now(), 'Solve': grid.solves[-1], 'Solution': solution(grid)})
+    solves.put(grid.solves[-1])
+
+
+def notify(published):
+    # Notify the front end of a new state.  If the previous notifications
+    # were not read yet, the front end will see this state anyway.
+    try:
+        published.send_bytes(b'')
+    except BlockingIOError:
+        pass
+
+
+def update_handler(state, setpoints, state_queue, solves, ready, published, *args, **kwargs):
+    """Handle messages that update the grid, i.e., implement a setpoint or switch a line.
+
+    Parameters
+    ----------
+        state : SharedState
+            Shared state in which the published fields of the state of the
+            grid are written.
+
+        setpoints : SetpointBuffer
+            Buffer in which the main process puts the messages.
+
+        state_queue : multiprocessing.Queue
+            Queue in which the updated state will be put for the logs.
+
+        solves : multiprocessing.Queue
+            Queue in which the metrics of every LF will be put for the
+            clients.
+
+        ready : multiprocessing.Event
+            Event that is set once the initial state is published.
+
+        published : multiprocessing.connection.Connection
+            Connection on which to notify the front end of every published
+            state.
 
     Raises
     ------
@@ -217,34 +729,66 @@ def update_handler(state, message_queue, state_queue, *args, **kwargs):
         slack_voltage_real = args[0]['slack_voltage']['voltage_real']
         slack_voltage_imaginary = args[0]['slack_voltage']['voltage_imaginary']
 
+    # Batches of setpoints that update at most this fraction of the buses are
+    # solved incrementally.
+    incremental_fraction = args[0].get('solver', {}).get('incremental_fraction', INCREMENTAL_FRACTION)
+
+    # Setpoints received within this window after the first one are
+    # coalesced in a single LF.
+    coalescing_window = args[0].get('solver', {}).get('coalescing_window', COALESCING_WINDOW) / 1e3
+
     # Initialize the grid.
-    grid = SinglePhaseGrid(*args, **kwargs)
+    grid = GRID_MODELS[args[0].get('model', 'singlephase')](*args, **kwargs)
+    three_phase = isinstance(grid, ThreePhaseGrid)
+    if grid.calibration is not None:
+        logger.info("Selected the {} algorithm, calibration: {}".format(grid.algorithm, grid.calibration))
     grid.update([0] * (grid.no_buses - 1), [0] * (grid.no_buses - 1), slack_voltage_real, slack_voltage_imaginary)
-    state.update(extract_state(grid))
-    logger.info("Initial state: {}".format(state))
-
-    state_log = state.copy()
-    state_log['Ts'] = datetime.now()
-    state_queue.put(state_log)
+    set_blocking(published.fileno(), False)
+    publish(grid, state, published, state_queue, solves, state.fields)
+    logger.info("Initial state: {}".format(state.read()[1]))
+    ready.set()
 
     reference_time = timer()
 
-    # Process and update messages one by one, and perform load-flow analysis.
+    # Wait for messages, coalesce them, and perform load-flow analysis.
     while True:
-        msg_qsize = message_queue.qsize()
-
-        if msg_qsize == 0:
-            continue
+        messages = setpoints.get(coalescing_window)
 
-        logger.info("Queue size in update_handler: {}".format(msg_qsize))
+        logger.info("Messages coalesced in update_handler: {}".format(len(messages)))
 
-        # Get these many messages from the message_queue...
+        # Keep the latest setpoint of every bus...
         index_with_updates = {}
-        for i in range(msg_qsize):
-            msg, _ = message_queue.get()
-            bus_index = int(msg['bus_index'])
-            Pd, Qd = float(msg['P']), float(msg['Q'])
-            index_with_updates[bus_index] = Pd, Qd
+        switched = False
+        for msg in messages:
+            if msg['type'] == 'switch_line':
+                switched = switch_line(grid, msg) or switched
+                continue
+            try:
+                bus_index = int(msg['bus_index'])
+                Pd, Qd = float(msg['P']), float(msg['Q'])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("Dropped setpoint {}: {}".format(msg, e))
+                continue
+            if not 1 <= bus_index < grid.no_buses:
+                # The slack bus has no setpoint.
+                logger.error("Dropped setpoint {}: bus index not in [1, {}]".format(msg, grid.no_buses - 1))
+                continue
+            if three_phase and msg.get('phase') is not None:
+                # Only update one phase of the bus.
+                Pd_bus, Qd_bus = index_with_updates.get(
+                    bus_index, (grid.pqBusesP[bus_index - 1], grid.pqBusesQ[bus_index - 1])
+                )
+                Pd_bus = list(Pd_bus) if isinstance(Pd_bus, list) else [Pd_bus / PHASES] * PHASES
+                Qd_bus = list(Qd_bus) if isinstance(Qd_bus, list) else [Qd_bus / PHASES] * PHASES
+                Pd_bus[int(msg['phase']) - 1] = Pd
+                Qd_bus[int(msg['phase']) - 1] = Qd
+                index_with_updates[bus_index] = Pd_bus, Qd_bus
+            else:
+                index_with_updates[bus_index] = Pd, Qd
+
+        if not index_with_updates and not switched:
+            logger.info("Nothing to update, no LF")
+            continue
 
         # Construct P, Q lists for doing LF with single update at all buses...
         # P, Q are the three phase voltage
@@ -290,17 +834,273 @@ def update_handler(state, message_queue, state_queue, *args, **kwargs):
 
         initial_time = datetime.now()
 
-        grid.update(Pd, Qd, slack_voltage_real, slack_voltage_imaginary)  # positive power is generation in grid model except slack bus power.
-        logger.info("LF took {} ms".
-                    format((datetime.now() - initial_time).total_seconds() * 1e3))
+        # positive power is generation in grid model except slack bus power.
+        # A new topology always requires a full LF.
+        incremental = not switched and len(index_with_updates) <= incremental_fraction * (grid.no_buses - 1)
+        try:
+            if incremental:
+                indices = list(index_with_updates)
+                iterations = grid.updatebuses(indices, [Pd[i - 1] for i in indices], [Qd[i - 1] for i in indices],
+                                              slack_voltage_real, slack_voltage_imaginary)
+            else:
+                iterations = grid.update(Pd, Qd, slack_voltage_real, slack_voltage_imaginary)
+        except Exception as e:
+            # Keep serving the last published state rather than dying.
+            logger.error("LF failed, state not published: {}".format(e), exc_info=True)
+            continue
+        logger.info("{} LF took {} ms ({})".
+                    format("Incremental" if incremental else "Full",
+                           (datetime.now() - initial_time).total_seconds() * 1e3,
+                           "approximated" if grid.approximated else "{} iterations".format(iterations)))
+        if not grid.converged:
+            logger.warning("LF did not converge within {} iterations (residual {})".
+                           format(iterations, grid.residual))
+
+        publish(grid, state, published, state_queue, solves, state.fields)
+
+        logger.info("Published state {}".format(state.sequence))
+
+
+class MessageHandler():
+    """Handler of the messages received by the grid module, for every front end.
 
-        state.update(extract_state(grid))
+    The time spent handling every message is recorded by type of message,
+    and the last `METRICS_HISTORY` ones of every type are summarized on a
+    `latency` request.
 
-        logger.info("Put state onto queue: {}".format(state))
+    Clients may also subscribe to the state, which is then pushed to them
+    after every LF until their lease expires, unless they renew it.
 
-        state_log = state.copy()
-        state_log['Ts'] = datetime.now()
-        state_queue.put(state_log)
+    """
+
+    def __init__(self, replies, setpoints, solves):
+        """Create a handler.
+
+        Parameters
+        ----------
+            replies : ReplyCache
+                Encoded replies to the state requests.
+
+            setpoints : SetpointBuffer
+                Buffer in which to put the setpoints and the line switchings.
+
+            solves : multiprocessing.Queue
+                Queue from which to collect the metrics of every LF.  Only
+                the last `METRICS_HISTORY` LFs are kept.
+
+        """
+        self.__replies = replies
+        self.__setpoints = setpoints
+        self.__solves = solves
+        self.__metrics = deque(maxlen=METRICS_HISTORY)
+        self.__counts = {}
+        self.__latencies = {}
+        self.__subscribers = {}  # Requested fields and expiry time, by address.
+
+    @property
+    def latency(self):
+        """Number of handled messages, and mean, median, 99th percentile and
+        largest handling time (in seconds) of the last ones, by type."""
+        return {
+            type_: {
+                'count': self.__counts[type_],
+                'mean': float(mean(latencies)),
+                'p50': float(percentile(latencies, 50)),
+                'p99': float(percentile(latencies, 99)),
+                'max': float(max(latencies))
+            } for type_, latencies in self.__latencies.items()
+        }
+
+    def __collect_metrics(self):
+        # Move the metrics of the last LFs from the queue to the history.
+        try:
+            while True:
+                self.__metrics.append(self.__solves.get_nowait())
+        except Empty:
+            pass
+
+    def __state_reply(self, fields, addr, send):
+        # Encoded state with the requested fields.  If some fields are not
+        # published, reply with an error rather than letting the client time
+        # out, and raise the KeyError.
+        try:
+            return self.__replies.reply(fields)
+        except KeyError as e:
+            send(dump_json_data({'error': "Unknown field: {}".format(e)}), addr)
+            raise
+
+    def handle(self, data, addr, send):
+        """Handle a message.
+
+        Parameters
+        ----------
+            data : bytes
+                Encoded message.
+
+            addr : tuple
+                Address of the sender.
+
+            send : callable
+                Function with which to send a reply, with the data and the
+                address, e.g., `socket.sendto`.
+
+        """
+        start_time = timer()
+        type_ = None
+        try:
+            message = load_json_data(data)
+            logger.debug("Received message from %s: %s", addr, message)
+            type_ = message['type']
+            if type_ == 'request':
+                # Only send the requested fields, if any.
+                reply = self.__state_reply(message.get('fields'), addr, send)
+                logger.debug("Send state %s to %s (%s bytes)", self.__replies.sequence, addr, len(reply))
+                send(reply, addr)
+            elif type_ in ('implement_setpoint', 'switch_line'):
+                phase = message.get('phase')
+                if phase is not None and not 1 <= int(phase) <= PHASES:
+                    # Phase 0 would otherwise silently update the third one.
+                    logger.warning("Setpoint with a phase not in [1, {}], dropped: {}".format(PHASES, message))
+                elif not self.__setpoints.put(message):
+                    logger.warning("Setpoint buffer full, dropped: {}".format(message))
+            elif type_ == 'metrics':
+                # Metrics of the last LFs, the last one at the end.
+                count = int(message.get('count', METRICS_REPLY))
+                self.__collect_metrics()
+                reply = {'solves': list(self.__metrics)[-count:] if count > 0 else []}
+                send(dump_json_data(reply), addr)
+            elif type_ == 'latency':
+                send(dump_json_data({'latency': self.latency}), addr)
+            elif type_ == 'subscribe':
+                # Reply with the current state, which also checks the fields.
+                fields = message.get('fields')
+                fields = None if fields is None else tuple(fields)
+                send(self.__state_reply(fields, addr, send), addr)
+                if addr not in self.__subscribers:
+                    logger.info("New subscriber {} to {}".format(addr, fields or "all the fields"))
+                self.__subscribers[addr] = fields, timer() + float(message.get('lease', SUBSCRIPTION_LEASE))
+            elif type_ == 'unsubscribe':
+                if self.__subscribers.pop(addr, None) is not None:
+                    logger.info("Subscriber {} left".format(addr))
+            else:
+                logger.warning("Unknown message type: {}".format(type_))
+                type_ = None
+        except Exception as e:
+            logger.warning("Bad message: {}".format(e))
+            type_ = None
+
+        if type_ is not None:
+            self.__counts[type_] = self.__counts.get(type_, 0) + 1
+            self.__latencies.setdefault(type_, deque(maxlen=METRICS_HISTORY)).append(timer() - start_time)
+
+
+    def push(self, send):
+        """Push the last published state to the subscribers.
+
+        It is called on every notification of a new state, and also collects
+        the metrics of the LFs published since the last call.
+
+        Parameters
+        ----------
+            send : callable
+                Function with which to send the state, with the data and the
+                address, e.g., `socket.sendto`.
+
+        """
+        self.__collect_metrics()
+        now = timer()
+        for addr, (fields, expiry) in list(self.__subscribers.items()):
+            if expiry < now:
+                logger.info("Subscription of {} expired".format(addr))
+                del self.__subscribers[addr]
+                continue
+            try:
+                send(self.__replies.reply(fields), addr)
+            except OSError as e:
+                logger.warning("Could not push the state to {}: {}".format(addr, e))
+                del self.__subscribers[addr]
+
+
+class GridProtocol(DatagramProtocol):
+    """Asyncio protocol of the grid module, which hands the messages to a handler."""
+
+    def __init__(self, handler):
+        self.__handler = handler
+        self.__transport = None
+
+    def connection_made(self, transport):
+        self.__transport = transport
+
+    def datagram_received(self, data, addr):
+        self.__handler.handle(data, addr, self.__transport.sendto)
+
+    def error_received(self, exc):
+        logger.warning("Socket error: {}".format(exc))
+
+
+def serve_blocking(sock, handler, published):
+    """Handle the messages one by one as they are received.
+
+    The states published by the LF process are pushed to the subscribers
+    between two messages.
+
+    Parameters
+    ----------
+        sock : socket.socket
+            Bound socket of the grid module.
+
+        handler : MessageHandler
+            Handler of the messages.
+
+        published : multiprocessing.connection.Connection
+            Connection on which the LF process notifies the published states.
+
+    """
+    while True:
+        readable, _, _ = select([sock, published], [], [])
+        if published in readable:
+            while published.poll():
+                published.recv_bytes()
+            handler.push(sock.sendto)
+        if sock in readable:
+            data, addr = sock.recvfrom(BUFFER_LIMIT)
+            handler.handle(data, addr, sock.sendto)
+
+
+def serve_asyncio(sock, handler, replies, published):
+    """Handle the messages in an asyncio event loop.
+
+    The loop also waits for the states published by the LF process, encodes
+    the reply to the requests for all the fields as soon as a state is
+    published, instead of on the next request, and pushes the state to the
+    subscribers.
+
+    Parameters
+    ----------
+        sock : socket.socket
+            Bound socket of the grid module.
+
+        handler : MessageHandler
+            Handler of the messages.
+
+        replies : ReplyCache
+            Encoded replies to the state requests.
+
+        published : multiprocessing.connection.Connection
+            Connection on which the LF process notifies the published states.
+
+    """
+    loop = new_event_loop()
+    transport, _ = loop.run_until_complete(loop.create_datagram_endpoint(lambda: GridProtocol(handler), sock=sock))
+
+    def on_published():
+        while published.poll():
+            published.recv_bytes()
+        replies.reply()
+        handler.push(transport.sendto)
+
+    loop.add_reader(published.fileno(), on_published)
+    loop.run_forever()
 
 
 def main():
@@ -335,51 +1135,76 @@ def main():
     api = GridAPI(args.grid_module_ip, int(args.grid_module_port))
     dump_api(api, args.api_path)
     kwargs = {'api_path': args.api_path}
+    kwargs.update(solver_kwargs(config['grid']))
+
+    # Fields of the state that are published for the requests.
+    published_fields = config['grid'].get('published_fields', list(STATE_FIELDS))
+    if not set(published_fields) <= STATE_FIELDS.keys():
+        logger.error("Unknown state fields: {}".format(set(published_fields) - STATE_FIELDS.keys()))
+        return 1
+
+    # Front end that receives the messages.
+    frontend = config['grid'].get('frontend', FRONTEND)
+    if frontend not in ('blocking', 'asyncio'):
+        logger.error("Unknown front end: {}".format(frontend))
+        return 1
+
+    # Shared memory for the published state, read without locks.
+    state = SharedState(state_shapes(config['grid'], published_fields))
+
+    # Socket to listen for incoming messages.
+    sock = socket(AF_INET, SOCK_DGRAM)
+    sock.bind((args.grid_module_ip, int(args.grid_module_port)))
+
+    # Handle update messages, through a lock-free buffer.
+    setpoints = SetpointBuffer()
+    state_queue = Queue()
+
+    # Metrics of every LF, for the clients.
+    solves = Queue()
+
+    # Encoded replies to the requests, for the last published state.
+    replies = ReplyCache(state)
+
+    # Set once the grid is initialized.
+    ready = Event()
+
+    # Notifications of the published states, for the front end.
+    notifications, published = Pipe(duplex=False)
+
+    # Monitor of the limits of the grid, for the logs.
+    shapes = state_shapes(config['grid'], ('Vm', 'LineCurrents'))
+    try:
+        monitor = ViolationMonitor(config['grid'], shapes['Vm'][0], shapes['LineCurrents'][0],
+                                   config['grid'].get('model') == 'threephase')
+    except ValueError as e:
+        logger.error("Invalid limits: {}".format(e))
+        return 1
+
+    lf_process = Process(target=update_handler,
+                         args=(state, setpoints, state_queue, solves, ready, published, config['grid']),
+                         kwargs=kwargs)
+    lf_process.start()
+
+    # Log generation.
+    log_process = Process(target=log_generator,
+                          args=(state_queue, args.log_path, config['grid'], monitor))
+    log_process.start()
+
+    # Wait for the child process to initialize the grid.
+    while not ready.wait(1):
+        if not lf_process.is_alive():
+            logger.error("The grid could not be initialized")
+            log_process.terminate()
+            return 1
 
-    # Initialize a multiprocessing manager.
-    with Manager() as manager:
-        # Shared memory for the state.
-        state = manager.dict()
-
-        # Socket to listen for incoming messages.
-        sock = socket(AF_INET, SOCK_DGRAM)
-        sock.bind((args.grid_module_ip, int(args.grid_module_port)))
-
-        # Handle update messages.
-        message_queue = manager.Queue()
-        state_queue = manager.Queue()
-
-        Process(target=update_handler,
-                args=(state, message_queue, state_queue, config['grid']),
-                kwargs=kwargs).start()
-
-        # Log generation.
-        Process(target=log_generator, args=(state_queue, args.log_path)).start()
-
-        # Wait for the child process to initialize the grid.
-        while not state:
-            continue
-
-        while True:
-            # The socket listens for messages that ask it to provide its state,
-            # or implement a new setpoint.
-            data, addr = sock.recvfrom(BUFFER_LIMIT)
-            message = load_json_data(data)
-            logger.info("Received message from {}: {}".format(addr, message))
-            try:
-                if message['type'] == 'request':
-                    reply = {key: value for key, value in state.items()}
-                    logger.info("Send state to {}: {}".format(addr, reply))
-                    sock.sendto(dump_json_data(reply), addr)
-                elif message['type'] == 'implement_setpoint':
-                    logger.info("Implement setpoint: {}".format(message))
-                    message_queue.put((message, datetime.now()))
-                    logger.info("Queue size: {}".format(message_queue.qsize()))
-                else:
-                    logger.warn(
-                        "Unknown message type: {}".format(message['type']))
-            except Exception as e:
-                logger.warn("Bad message: {}".format(e))
+    # The socket listens for messages that ask it to provide its state,
+    # implement a new setpoint, or switch a line.
+    handler = MessageHandler(replies, setpoints, solves)
+    if frontend == 'asyncio':
+        serve_asyncio(sock, handler, replies, notifications)
+    else:
+        serve_blocking(sock, handler, notifications)
 
     return 0
 
@@ -164,7 +164,7 @@ def update(api, bus_indices, default_line_frequency, period, use_trace, trace_pa
     Parameters
     ----------
         api : GridAPI
-            API to use to query the grid for the state.
+            API to use to subscribe to the state of the grid.
 
         bus_indices : iterable
             Which buses to obtain the state for.
@@ -228,20 +228,27 @@ def update(api, bus_indices, default_line_frequency, period, use_trace, trace_pa
 
     message = {}
 
-    while True:
-
-        try:
-            new_state = api.get_state(period)
-        except timeout as e:
-            logger.warning("Could not retrieve state from GridAPI: {}"
-                           .format(e))
-            continue
+    # The grid module pushes every new state, starting with the current one.
+    subscription = api.subscribe()
+    next_update = start_time + period
 
-        logger.info("Retrieved state from GridAPI: {}".format(new_state))
+    while True:
 
-        if state != new_state:
+        # Keep the last state pushed until the end of the period, so that the
+        # information is updated once per period.
+        new_state = None
+        remaining = next_update - default_timer()
+        while remaining > 0:
+            try:
+                new_state = subscription.get(remaining)
+            except timeout:
+                break
+            remaining = next_update - default_timer()
+
+        if new_state is not None:
             # Update the state.
-            state = new_state.copy()
+            logger.info("Received a new state from the grid module")
+            state = new_state
 
             message = {
                 'freq': line_frequency,
@@ -253,6 +260,20 @@ def update(api, bus_indices, default_line_frequency, period, use_trace, trace_pa
             ):
                 if bus_index not in bus_indices:
                     continue
+                if isinstance(Vm, list):
+                    # Three-phase grid: phase-to-neutral voltages and power of
+                    # every phase.
+                    for phase_index, (P_phase, Q_phase, Vm_phase, Va_phase) in enumerate(zip(P, Q, Vm, Va), 1):
+                        phase_angle = radians(Va_phase)
+                        message['buses'].append(
+                            make_entry(
+                                bus_index, phase_index,
+                                P_phase, Q_phase,
+                                Vm_phase * cos(phase_angle),
+                                Vm_phase * sin(phase_angle)
+                            )
+                        )
+                    continue
                 for phase_index, phase_shift in enumerate((0, 120, -120), 1):
                     phase_angle = radians(Va + phase_shift)
                     message['buses'].append(
@@ -305,7 +326,7 @@ def update(api, bus_indices, default_line_frequency, period, use_trace, trace_pa
         state_queue.put(msg_copy)
 
         elapsed_time = default_timer() - start_time
-        sleep(period - elapsed_time % period)
+        next_update = default_timer() + period - elapsed_time % period
 
 
 def send(sock, addrs):
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Shared-memory blocks that the processes of the grid module exchange.
+
+The state of the grid is published in a fixed layout of NumPy arrays that the
+main process reads without locks, and the setpoints are passed to the process
+that runs the load flows through a lock-free ring buffer, so that neither
+goes through a multiprocessing manager.
+
+"""
+
+from ctypes import c_double, c_uint64
+from multiprocessing import Event
+from multiprocessing.sharedctypes import RawArray
+from numpy import frombuffer, float64, uint64, prod, nan, isnan
+from time import sleep
+
+
+SETPOINT_CAPACITY = 4096  # Number of messages that the setpoint buffer can hold.
+
+# Records of the setpoint buffer: kind of message, index of the bus or line,
+# and the values of the message.
+RECORD_SIZE = 5
+SETPOINT, SWITCH = 0, 1
+
+
+class SharedState():
+    """State of the grid in shared memory.
+
+    Every field of the state is a NumPy array of fixed shape in a shared
+    buffer.  The writer increments a sequence counter before and after every
+    update, so that the readers copy the state without locks, and retry if it
+    was updated while they were copying it.  There must be one writer only.
+
+    """
+
+    def __init__(self, shapes):
+        """Allocate the shared memory of the state.
+
+        Parameters
+        ----------
+            shapes : dict
+                Shape of every field of the state.
+
+        """
+        self.__shapes = dict(shapes)
+        self.__buffer = RawArray(c_double, sum(int(prod(shape)) for shape in self.__shapes.values()))
+        self.__sequence = RawArray(c_uint64, 1)
+        self.__view()
+
+    def __view(self):
+        # NumPy views of the shared memory, one per field.
+        buffer = frombuffer(self.__buffer, float64)
+        self.__fields = {}
+        offset = 0
+        for field, shape in self.__shapes.items():
+            size = int(prod(shape))
+            self.__fields[field] = buffer[offset:offset + size].reshape(shape)
+            offset += size
+        self.__counter = frombuffer(self.__sequence, uint64)
+
+    def __getstate__(self):
+        # Only the shared memory is passed to other processes, not the views.
+        return self.__shapes, self.__buffer, self.__sequence
+
+    def __setstate__(self, state):
+        self.__shapes, self.__buffer, self.__sequence = state
+        self.__view()
+
+    @property
+    def fields(self):
+        return tuple(self.__shapes)
+
+    @property
+    def sequence(self):
+        """Number of states that were written."""
+        return int(self.__counter[0]) // 2
+
+    def write(self, state):
+        """Write a new state.
+
+        Parameters
+        ----------
+            state : dict
+                Values of the fields of the state.  The other fields keep
+                their previous values.
+
+        """
+        self.__counter[0] += 1  # Odd while the state is being written.
+        for field, values in state.items():
+            self.__fields[field][...] = values
+        self.__counter[0] += 1
+
+    def read(self, fields=None):
+        """Read a consistent copy of the state.
+
+        Parameters
+        ----------
+            fields : iterable of str (optional, default all fields)
+                Fields of the state to read.
+
+        Returns
+        -------
+            sequence : int
+                Number of states that were written before this one.
+
+            state : dict
+                Copy of the fields of the state.
+
+        Raises
+        ------
+            error : KeyError
+                A field is not in the state.
+
+        """
+        fields = self.fields if fields is None else fields
+        while True:
+            counter = int(self.__counter[0])
+            if counter % 2:
+                continue
+            state = {field: self.__fields[field].copy() for field in fields}
+            if int(self.__counter[0]) == counter:
+                return counter // 2, state
+
+
+class SetpointBuffer():
+    """Ring buffer of setpoint and line-switching messages in shared memory.
+
+    There must be one producer and one consumer.  The producer only advances
+    the head of the buffer and the consumer only advances its tail, so that
+    neither needs a lock, and an event wakes the consumer up when messages
+    are waiting.
+
+    """
+
+    def __init__(self, capacity=SETPOINT_CAPACITY):
+        """Allocate the shared memory of the buffer.
+
+        Parameters
+        ----------
+            capacity : int (optional, default SETPOINT_CAPACITY)
+                Number of messages that the buffer can hold.
+
+        """
+        self.__capacity = capacity
+        self.__buffer = RawArray(c_double, capacity * RECORD_SIZE)
+        self.__positions = RawArray(c_uint64, 2)
+        self.__event = Event()
+        self.__view()
+
+    def __view(self):
+        # NumPy views of the records and of the head and tail positions.
+        self.__records = frombuffer(self.__buffer, float64).reshape(self.__capacity, RECORD_SIZE)
+        positions = frombuffer(self.__positions, uint64)
+        self.__head, self.__tail = positions[:1], positions[1:]
+
+    def __getstate__(self):
+        # Only the shared memory is passed to other processes, not the views.
+        return self.__capacity, self.__buffer, self.__positions, self.__event
+
+    def __setstate__(self, state):
+        self.__capacity, self.__buffer, self.__positions, self.__event = state
+        self.__view()
+
+    def put(self, message):
+        """Put a message in the buffer.
+
+        Parameters
+        ----------
+            message : dict
+                Message of type `implement_setpoint` or `switch_line`.
+
+        Returns
+        -------
+            put : bool
+                Whether the message was put, i.e., the buffer was not full.
+
+        Raises
+        ------
+            error : KeyError, TypeError or ValueError
+                The message is missing a value, or has a wrong one.
+
+        """
+        if message['type'] == 'switch_line':
+            record = SWITCH, int(message['line']), bool(message['closed']), 0, nan
+        else:
+            phase = message.get('phase')
+            record = (SETPOINT, int(message['bus_index']), float(message['P']), float(message['Q']),
+                      nan if phase is None else int(phase))
+
+        head = int(self.__head[0])
+        if head - int(self.__tail[0]) >= self.__capacity:
+            return False
+        self.__records[head % self.__capacity] = record
+        self.__head[0] = head + 1
+        self.__event.set()
+        return True
+
+    def get(self, window=0):
+        """Wait for messages, and get all the messages of a coalescing window.
+
+        Parameters
+        ----------
+            window : float (optional, default 0)
+                Time (in seconds), after the first message, during which the
+                messages are gathered.  With no window, only the messages
+                that are already in the buffer are returned.
+
+        Returns
+        -------
+            messages : list of dict
+                Messages, in the order in which they were put.
+
+        """
+        while True:
+            self.__event.wait()
+            if window > 0:
+                sleep(window)
+            self.__event.clear()
+
+            head, tail = int(self.__head[0]), int(self.__tail[0])
+            messages = [self.__message(self.__records[position % self.__capacity])
+                        for position in range(tail, head)]
+            self.__tail[0] = head
+            if messages:
+                return messages
+
+    @staticmethod
+    def __message(record):
+        # Message of a record of the buffer.
+        kind, index, first, second, phase = record.tolist()
+        if kind == SWITCH:
+            return {'type': 'switch_line', 'line': int(index), 'closed': bool(first)}
+        return {'type': 'implement_setpoint', 'bus_index': int(index), 'P': first, 'Q': second,
+                'phase': None if isnan(phase) else int(phase)}
@@ -0,0 +1,115 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Tests of the grid module.
+
+Run with `python -m pytest src/module` from the T-RECS root directory.
+
+"""
+
+from math import sqrt
+from os import path
+import sys
+
+from numpy import array, full
+from pytest import raises
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), path.pardir)
+sys.path[:0] = [path.join(SRC_DIR, 'model', 'grid', 'singlephase'),
+                path.join(SRC_DIR, 'model', 'grid', 'threephase'),
+                path.join(SRC_DIR, 'api'),
+                path.join(SRC_DIR, 'util')]
+
+from gridmodule import ViolationMonitor, ReplyCache
+from sharedstate import SharedState
+from snippets import load_json_data
+
+
+def feeder_config():
+    # Feeder of three buses, with an ampacity on the first line and a
+    # tighter voltage band at the last bus.
+    line = {'R': 0.1, 'X': 0.05, 'B': 0}
+    return {
+        'lines': [dict(line, **{'from': 0, 'to': 1, 'ampacity': 100}), dict(line, **{'from': 1, 'to': 2})],
+        'base_quantities': {'V': 400, 'S': 1e5},
+        'voltage_limits': {'min': 0.9, 'max': 1.1},
+        'bus_voltage_limits': [{'bus': 2, 'min': 0.95}]
+    }
+
+
+def events(monitor, Vm, LineCurrents, timestamp):
+    # (event, type, index, value, duration) of the events of a state.
+    return [(event['Event'], event['Type'], event['Index'], round(event['Value'], 6), event['Duration'])
+            for event in monitor.check({'Vm': array(Vm), 'LineCurrents': array(LineCurrents)}, timestamp)]
+
+
+def test_violation_events():
+    monitor = ViolationMonitor(feeder_config(), 3, 2)
+    assert events(monitor, [400, 395, 390], [0, 0], 0) == []
+    assert events(monitor, [400, 390, 370], [0, 0], 1) == [('start', 'undervoltage', 2, 370, None)]
+
+    # The line currents of the single-phase model are sqrt(3) times the
+    # phase currents, which are compared with the ampacity.
+    assert events(monitor, [400, 385, 360], [200 * sqrt(3), 0], 2) == [('start', 'overload', 0, 200, None)]
+    assert events(monitor, [400, 385, 365], [150 * sqrt(3), 0], 3) == []
+    assert monitor.active == {'overload': 1, 'undervoltage': 1, 'overvoltage': 0}
+
+    # An end event has the worst value and the duration of the violation.
+    assert events(monitor, [400, 395, 390], [0, 0], 4) == [('end', 'overload', 0, 200, 2),
+                                                           ('end', 'undervoltage', 2, 360, 3)]
+    assert monitor.active == {'overload': 0, 'undervoltage': 0, 'overvoltage': 0}
+
+
+def test_violation_events_three_phase():
+    # Phase-to-neutral voltages, with one column per phase.
+    monitor = ViolationMonitor(feeder_config(), 3, 2, three_phase=True)
+    Vm = full((3, 3), 230.0)
+    Vm[1, 2] = 260
+    event, = monitor.check({'Vm': Vm, 'LineCurrents': full((2, 3), 10.0)}, 0)
+    assert (event['Type'], event['Index'], event['PhaseIndex']) == ('overvoltage', 1, 3)
+    assert event['Limit'] == 1.1 * 400 / sqrt(3)
+
+
+def test_violation_unknown_bus():
+    config = feeder_config()
+    config['bus_voltage_limits'].append({'bus': 3, 'max': 1.05})
+    with raises(ValueError):
+        ViolationMonitor(config, 3, 2)
+
+
+def test_reply_cache():
+    state = SharedState({'Vm': (3,), 'Va': (3,)})
+    state.write({'Vm': array([400, 395, 390]), 'Va': array([0, -1, -2])})
+    replies = ReplyCache(state)
+
+    # The replies are encoded once per state and set of fields.
+    reply = replies.reply()
+    assert load_json_data(reply) == {'Vm': [400, 395, 390], 'Va': [0, -1, -2]}
+    assert replies.reply() is reply and replies.sequence == 1
+    assert load_json_data(replies.reply(['Vm'])) == {'Vm': [400, 395, 390]}
+    with raises(KeyError):
+        replies.reply(['P'])
+
+    state.write({'Vm': array([400, 390, 380])})
+    assert load_json_data(replies.reply(['Vm'])) == {'Vm': [400, 390, 380]}
+    assert replies.reply() is not reply and replies.sequence == 2
@@ -0,0 +1,113 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Tests of the shared-memory blocks of the grid module.
+
+Run with `python -m pytest src/module` from the T-RECS root directory.
+
+"""
+
+from multiprocessing import Process
+
+from numpy import arange, zeros, array_equal
+from pytest import raises
+
+from sharedstate import SharedState, SetpointBuffer
+
+
+def write_states(state, count):
+    for k in range(count):
+        state.write({'Vm': arange(4) + k, 'LineCurrents': zeros((3, 3)) + k})
+
+
+def put_messages(setpoints, messages):
+    for message in messages:
+        setpoints.put(message)
+
+
+def test_shared_state():
+    state = SharedState({'Vm': (4,), 'LineCurrents': (3, 3)})
+    assert state.fields == ('Vm', 'LineCurrents') and state.sequence == 0
+
+    state.write({'Vm': arange(4), 'LineCurrents': zeros((3, 3))})
+    state.write({'Vm': arange(4) + 1})
+    sequence, values = state.read()
+    assert sequence == 2
+    assert array_equal(values['Vm'], arange(4) + 1) and array_equal(values['LineCurrents'], zeros((3, 3)))
+
+    # The reader gets a copy of the requested fields only.
+    _, values = state.read(['Vm'])
+    values['Vm'][:] = 0
+    assert list(values) == ['Vm'] and array_equal(state.read()[1]['Vm'], arange(4) + 1)
+    with raises(KeyError):
+        state.read(['P'])
+
+
+def test_shared_state_process():
+    # The states written by another process are read consistently.
+    state = SharedState({'Vm': (4,), 'LineCurrents': (3, 3)})
+    writer = Process(target=write_states, args=(state, 1000))
+    writer.start()
+    while writer.is_alive():
+        sequence, values = state.read()
+        if sequence == 0:
+            continue
+        k = values['Vm'][0]
+        assert k == sequence - 1
+        assert array_equal(values['Vm'], arange(4) + k) and (values['LineCurrents'] == k).all()
+    writer.join()
+    sequence, values = state.read()
+    assert sequence == 1000 and values['Vm'][0] == 999
+
+
+def test_setpoint_buffer():
+    setpoints = SetpointBuffer(capacity=3)
+    messages = [
+        {'type': 'implement_setpoint', 'bus_index': 2, 'P': -1e3, 'Q': 1e2, 'phase': None},
+        {'type': 'switch_line', 'line': 4, 'closed': False},
+        {'type': 'implement_setpoint', 'bus_index': 3, 'P': 5e2, 'Q': 0, 'phase': 2}
+    ]
+    assert all(setpoints.put(message) for message in messages)
+    assert not setpoints.put(messages[0])
+    assert setpoints.get() == messages
+
+    # The buffer wraps around.
+    assert setpoints.put(messages[1])
+    assert setpoints.get() == messages[1:2]
+
+    with raises(KeyError):
+        setpoints.put({'type': 'implement_setpoint', 'bus_index': 2})
+
+
+def test_setpoint_buffer_process():
+    # The messages put by another process are got in order.
+    setpoints = SetpointBuffer(capacity=100)
+    messages = [{'type': 'implement_setpoint', 'bus_index': k, 'P': float(k), 'Q': 0.0, 'phase': None}
+                for k in range(50)]
+    producer = Process(target=put_messages, args=(setpoints, messages))
+    producer.start()
+    received = []
+    while len(received) < len(messages):
+        received += setpoints.get()
+    producer.join()
+    assert received == messages
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of the load-flow solvers on synthetic feeders.
+
+Generates radial and weakly-meshed feeders of increasing size in the format
+of the grid configuration, and times the construction of `SinglePhaseGrid`,
+full (`update`) and single-bus (`updatebus`) load flows, `computeCurrents`
+and `extract_state` for every algorithm.  Every case runs in a fresh worker
+process, whose peak memory is reported together with the latency
+percentiles in a JSON report.
+
+"""
+
+from argparse import ArgumentParser
+from json import dump
+from logging import basicConfig, getLogger, INFO
+from multiprocessing import get_context
+from os import path, makedirs, cpu_count
+from platform import python_version, machine
+from resource import getrusage, RUSAGE_SELF
+from sys import stdout, exit
+from timeit import default_timer as timer
+
+import numpy
+import scipy
+from numpy import array, percentile
+from numpy.random import default_rng
+
+import sourcepaths  # Makes the grid model and the utilities importable.
+
+from singlephasegrid import SinglePhaseGrid
+from gridmodule import extract_state
+
+basicConfig(stream=stdout, level=INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = getLogger('grid.benchmark')
+
+
+ALGORITHMS = ('CW', 'SCW', 'NR', 'BFS', 'FDLF')
+SIZES = (10, 100, 1000, 10000, 50000)
+TOPOLOGIES = ('radial', 'meshed')
+OPERATIONS = ('init', 'update', 'updatebus', 'computeCurrents', 'extract_state')
+PERCENTILES = (50, 90, 99)
+
+# Medium-voltage feeder: base quantities, and total load (W) spread over the
+# buses with a power factor of about 0.95.
+BASE_QUANTITIES = {'V': 20e3, 'S': 1e6}
+TOTAL_LOAD = 5e6
+REACTIVE_RATIO = 0.33
+
+
+def synthetic_feeder(no_buses, topology, rng, meshing=0.01):
+    """Generate a synthetic feeder in the grid configuration format.
+
+    Every bus is connected to a random earlier bus, which gives a radial
+    feeder with a depth that grows with the logarithm of its size.  A
+    weakly-meshed feeder has `meshing` times as many additional lines between
+    random buses.
+
+    Parameters
+    ----------
+        no_buses : int
+            Number of buses, including the slack bus.
+
+        topology : {'radial', 'meshed'}
+            Topology of the feeder.
+
+        rng : numpy.random.Generator
+            Random number generator.
+
+        meshing : float (optional, default 0.01)
+            Number of additional lines of a meshed feeder, per bus.
+
+    Returns
+    -------
+        config : dict
+            Grid configuration, with the `grid` section holding the lines, the
+            base quantities and the slack voltage.
+
+    """
+    ends = [(int(rng.integers(bus)), bus) for bus in range(1, no_buses)]
+    if topology == 'meshed':
+        for _ in range(max(int(round(meshing * no_buses)), 1)):
+            src, dst = sorted(rng.choice(no_buses, 2, replace=False).tolist())
+            ends.append((src, dst))
+
+    # Short medium-voltage cables.
+    lines = [{
+        'from': src,
+        'to': dst,
+        'R': float(rng.uniform(0.02, 0.2)),
+        'X': float(rng.uniform(0.02, 0.1)),
+        'B': float(rng.uniform(1e-6, 1e-5))
+    } for src, dst in ends]
+
+    return {
+        'grid': {
+            'lines': lines,
+            'base_quantities': dict(BASE_QUANTITIES),
+            'slack_voltage': {
+                'use_trace': False,
+                'voltage_real': BASE_QUANTITIES['V'],
+                'voltage_imaginary': 0
+            }
+        }
+    }
+
+
+def injections(no_buses, rng, spread=0.5):
+    """Random loads of the PQ buses around the mean load.
+
+    Parameters
+    ----------
+        no_buses : int
+            Number of buses, including the slack bus.
+
+        rng : numpy.random.Generator
+            Random number generator.
+
+        spread : float (optional, default 0.5)
+            Relative spread of the loads around the mean load.
+
+    Returns
+    -------
+        P, Q : list of float
+            Active (W) and reactive (Var) power of the PQ buses (negative for
+            loads).
+
+    """
+    P = - TOTAL_LOAD / (no_buses - 1) * rng.uniform(1 - spread, 1 + spread, no_buses - 1)
+    return P.tolist(), (P * REACTIVE_RATIO).tolist()
+
+
+def statistics(samples):
+    """Latency statistics (in ms) of samples in seconds.
+
+    Parameters
+    ----------
+        samples : list of float
+            Samples, in seconds.
+
+    Returns
+    -------
+        statistics : dict
+            Number of samples, and mean, min, max and percentiles (in ms).
+
+    """
+    samples = array(samples) * 1e3
+    result = {
+        'mean': samples.mean(),
+        'min': samples.min(),
+        'max': samples.max()
+    }
+    result.update({'p{}'.format(q): value for q, value in zip(PERCENTILES, percentile(samples, PERCENTILES))})
+    result = {key: float(value) for key, value in result.items()}
+    result['count'] = len(samples)
+    return result
+
+
+def peak_memory():
+    # Peak resident set size of the process, in MB (ru_maxrss is in kB).
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(case):
+    """Benchmark one algorithm on one feeder, in a worker process.
+
+    Parameters
+    ----------
+        case : dict
+            Feeder configuration, algorithm, and benchmark settings.
+
+    Returns
+    -------
+        result : dict
+            Latency statistics of every operation, iterations and convergence
+            of the load flows, and increase of the peak memory of the worker.
+
+    """
+    baseline_memory = peak_memory()
+    config = case['config']['grid']
+    slack_voltage = config['slack_voltage']['voltage_real'], config['slack_voltage']['voltage_imaginary']
+    rng = default_rng(case['seed'])
+    samples = {operation: [] for operation in OPERATIONS}
+    iterations = []
+    converged = []
+
+    for _ in range(case['init_repeats']):
+        start_time = timer()
+        grid = SinglePhaseGrid(config, ALG=case['algorithm'], voltage_tolerance=case['tolerance'],
+                               max_iter=case['max_iter'])
+        samples['init'].append(timer() - start_time)
+
+    P, Q = injections(grid.no_buses, rng)
+    grid.update(P, Q, *slack_voltage)
+
+    for _ in range(case['repeats']):
+        # Full load flow of a new operating point.
+        P, Q = injections(grid.no_buses, rng)
+        start_time = timer()
+        grid.update(P, Q, *slack_voltage)
+        samples['update'].append(timer() - start_time)
+        iterations.append(grid.iterations)
+        converged.append(grid.converged)
+
+        # The derived quantities of a new solution are computed on first
+        # access, i.e., by extract_state.
+        start_time = timer()
+        extract_state(grid)
+        samples['extract_state'].append(timer() - start_time)
+
+        start_time = timer()
+        grid.computeCurrents()
+        samples['computeCurrents'].append(timer() - start_time)
+
+        # Load flow after a setpoint of a single bus.
+        bus = int(rng.integers(1, grid.no_buses))
+        start_time = timer()
+        grid.updatebus(bus, P[bus - 1] * rng.uniform(0.5, 1.5), Q[bus - 1])
+        samples['updatebus'].append(timer() - start_time)
+
+    return {
+        'timings_ms': {operation: statistics(values) for operation, values in samples.items()},
+        'iterations': {'mean': float(array(iterations).mean()), 'max': int(max(iterations))},
+        'converged': float(array(converged).mean()),
+        'peak_memory_mb': peak_memory() - baseline_memory
+    }
+
+
+def main():
+    # Parse the arguments.
+    parser = ArgumentParser(
+        description="Benchmark of the load-flow solvers on synthetic feeders."
+    )
+    parser.add_argument("output_path",
+                        help="Path to the directory to which to write the report")
+    parser.add_argument("--sizes",
+                        help="Number of buses of the feeders",
+                        type=int, nargs='+', default=list(SIZES))
+    parser.add_argument("--topologies",
+                        help="Topologies of the feeders",
+                        nargs='+', choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--algorithms",
+                        help="Load-flow algorithms",
+                        nargs='+', choices=ALGORITHMS, default=list(ALGORITHMS))
+    parser.add_argument("--repeats",
+                        help="Number of operating points per case",
+                        type=int, default=20)
+    parser.add_argument("--init_repeats",
+                        help="Number of constructions of the grid per case",
+                        type=int, default=3)
+    parser.add_argument("--max_dense_buses",
+                        help="Largest feeder for the dense CW algorithm",
+                        type=int, default=2000)
+    parser.add_argument("--tolerance",
+                        help="Voltage tolerance of the load flows",
+                        type=float, default=1e-10)
+    parser.add_argument("--max_iter",
+                        help="Maximum number of iterations per load flow",
+                        type=int, default=100)
+    parser.add_argument("--seed",
+                        help="Seed of the random number generator",
+                        type=int, default=0)
+    parser.add_argument("--write_grids",
+                        help="Also write the feeders, as grid configuration files",
+                        action='store_true')
+    args = parser.parse_args()
+
+    makedirs(args.output_path, exist_ok=True)
+    report = {
+        'platform': {
+            'python': python_version(),
+            'numpy': numpy.__version__,
+            'scipy': scipy.__version__,
+            'machine': machine(),
+            'cpu_count': cpu_count()
+        },
+        'settings': vars(args),
+        'cases': []
+    }
+
+    rng = default_rng(args.seed)
+    # A fresh process per case, so that the peak memory of a case does not
+    # include the previous ones.
+    with get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+        for topology in args.topologies:
+            for no_buses in args.sizes:
+                config = synthetic_feeder(no_buses, topology, rng)
+                if args.write_grids:
+                    with open(path.join(args.output_path, 'grid_{}_{}.json'.format(topology, no_buses)), 'w') as f:
+                        dump(config, f)
+
+                for algorithm in args.algorithms:
+                    result = {
+                        'topology': topology,
+                        'no_buses': no_buses,
+                        'no_lines': len(config['grid']['lines']),
+                        'algorithm': algorithm
+                    }
+                    if algorithm == 'BFS' and topology != 'radial':
+                        result.update(status='skipped', reason="The backward/forward sweep requires a radial grid")
+                    elif algorithm == 'CW' and no_buses > args.max_dense_buses:
+                        result.update(status='skipped', reason="Dense matrices above {} buses"
+                                      .format(args.max_dense_buses))
+                    else:
+                        case = {'config': config, 'algorithm': algorithm, 'seed': int(rng.integers(2 ** 32)),
+                                'repeats': args.repeats, 'init_repeats': args.init_repeats,
+                                'tolerance': args.tolerance, 'max_iter': args.max_iter}
+                        try:
+                            result.update(pool.apply(run_case, (case,)), status='ok')
+                        except Exception as e:
+                            result.update(status='failed', reason=str(e))
+
+                    if result['status'] == 'ok':
+                        logger.info("{} feeder, {} buses, {}: update p50 {:.3f} ms, init p50 {:.3f} ms, "
+                                    "{:.1f} MB".format(topology, no_buses, algorithm,
+                                                       result['timings_ms']['update']['p50'],
+                                                       result['timings_ms']['init']['p50'],
+                                                       result['peak_memory_mb']))
+                    else:
+                        logger.info("{} feeder, {} buses, {}: {} ({})".format(
+                            topology, no_buses, algorithm, result['status'], result['reason']))
+                    report['cases'].append(result)
+
+                    # Write the report as the cases complete.
+                    with open(path.join(args.output_path, 'benchmark.json'), 'w') as f:
+                        dump(report, f, indent=1)
+
+    return 0 if all(case['status'] != 'failed' for case in report['cases']) else 1
+
+
+if __name__ == '__main__':
+    exit(main())
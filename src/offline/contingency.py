@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Offline N-1 contingency screening of the grid.
+
+Removes every line of the grid in turn and solves the load flow of the
+operating points of the scenario at given times.  The outages are solved
+with low-rank updates of the base-case factorization of the grid (see
+`SinglePhaseGrid.update_outage`), and spread across a pool of worker
+processes.
+
+"""
+
+from argparse import ArgumentParser
+from csv import writer
+from logging import basicConfig, getLogger, INFO
+from multiprocessing import get_context, cpu_count
+from os import path, makedirs
+from sys import stdout, exit
+from timeit import default_timer as timer
+
+from numpy import array, arange, column_stack, repeat, tile, full, absolute, angle, \
+    maximum, savetxt
+
+import sourcepaths  # Makes the grid model and the utilities importable.
+
+from singlephasegrid import SinglePhaseGrid
+from gridmodule import solver_kwargs
+from snippets import load_json_file
+from profiles import resource_profiles, bus_injections, slack_voltage_profile
+
+basicConfig(stream=stdout, level=INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = getLogger('grid.contingency')
+
+
+BASE_CASE = -1  # Outage index of the base case in the results.
+
+# Study shared with the workers.  It is set before the pool is created and
+# inherited by the forked workers, so that the factorized grid is never
+# pickled.
+study = None
+
+
+def solve_outage(line):
+    """Solve the operating points with a line out of service.
+
+    Parameters
+    ----------
+        line : int
+            Index of the line out of service, or BASE_CASE.
+
+    Returns
+    -------
+        (line, state) : tuple
+            The line, and a dict with the voltage magnitudes and angles 'Vm'
+            and 'Va' (one row per operating point), the line currents
+            'LineCurrents', the number of energized buses 'Energized' and
+            whether the load flow converged 'Converged'.
+
+    """
+    grid = study['grid']
+    if line == BASE_CASE:
+        V, _, forwardCurrents, backwardCurrents = grid.update_batch(study['P'], study['Q'], study['V0'])
+        energized = grid.no_buses
+    else:
+        V, _, forwardCurrents, backwardCurrents = grid.update_outage(line, study['P'], study['Q'], study['V0'])
+        energized = grid.outage_energized.sum()
+
+    return line, {
+        'Vm': absolute(V),
+        'Va': angle(V),
+        'LineCurrents': maximum(absolute(forwardCurrents), absolute(backwardCurrents)),
+        'Energized': energized,
+        'Converged': grid.batch_converged
+    }
+
+
+def main():
+    # Parse the arguments.
+    parser = ArgumentParser(
+        description="Offline N-1 contingency screening of the grid."
+    )
+    parser.add_argument("grid_config_path",
+                        help="Path to the JSON config file for the grid")
+    parser.add_argument("resource_config_path",
+                        help="Path to the JSON config file for the resources")
+    parser.add_argument("output_path",
+                        help="Path to the directory to which to write the results")
+    parser.add_argument("--times",
+                        help="Times (in seconds) of the operating points to screen",
+                        type=float, nargs='+', default=[0])
+    parser.add_argument("--lines",
+                        help="Lines to put out of service (default all)",
+                        type=int, nargs='+', default=None)
+    parser.add_argument("--processes",
+                        help="Number of worker processes",
+                        type=int, default=cpu_count())
+    args = parser.parse_args()
+
+    # Load the configuration files.
+    config = load_json_file(args.grid_config_path, logger)
+    resource_config = load_json_file(args.resource_config_path, logger)
+
+    if config['grid'].get('model', 'singlephase') != 'singlephase':
+        logger.error("Only the single-phase grid model is supported, not {}".format(config['grid']['model']))
+        return 1
+
+    profiles = resource_profiles(
+        config, resource_config,
+        path.dirname(path.abspath(args.resource_config_path)), logger)
+    slack_voltage = slack_voltage_profile(config['grid']['slack_voltage'])
+
+    grid = SinglePhaseGrid(config['grid'], **solver_kwargs(config['grid']))
+    times = array(args.times)
+    P, Q = bus_injections(profiles, grid.no_buses, times)
+
+    global study
+    study = {'grid': grid, 'P': P, 'Q': Q, 'V0': slack_voltage(times)}
+
+    lines = range(grid.no_lines) if args.lines is None else args.lines
+    outages = [BASE_CASE] + list(lines)
+    logger.info("Screen {} outages at {} operating points on {} processes"
+                .format(len(outages) - 1, len(times), args.processes))
+
+    makedirs(args.output_path, exist_ok=True)
+    start_time = timer()
+    no_failures = 0
+
+    with get_context('fork').Pool(args.processes) as pool, \
+            open(path.join(args.output_path, 'contingency_bus.csv'), 'w', newline='') as file_bus, \
+            open(path.join(args.output_path, 'contingency_line.csv'), 'w', newline='') as file_line, \
+            open(path.join(args.output_path, 'contingency_summary.csv'), 'w', newline='') as file_summary:
+        file_bus.write('Outage,Timestamp,BusIndex,Vm,Va\n')
+        file_line.write('Outage,Timestamp,Line #,LineCurrent\n')
+        summary = writer(file_summary)
+        summary.writerow(['Outage', 'EnergizedBuses', 'MinVm', 'MaxVm', 'MaxLineCurrent', 'Converged'])
+
+        for i, (line, state) in enumerate(pool.imap(solve_outage, outages), 1):
+            if not state['Converged']:
+                no_failures += 1
+                logger.warning("The load flow without line {} did not converge".format(line))
+
+            no_steps, no_buses = state['Vm'].shape
+            savetxt(file_bus, column_stack((
+                full(no_steps * no_buses, line), repeat(times, no_buses), tile(arange(no_buses), no_steps),
+                state['Vm'].ravel(), state['Va'].ravel()
+            )), fmt=('%d', '%.3f', '%d', '%.15g', '%.15g'), delimiter=',')
+
+            no_lines = state['LineCurrents'].shape[1]
+            savetxt(file_line, column_stack((
+                full(no_steps * no_lines, line), repeat(times, no_lines), tile(arange(no_lines), no_steps),
+                state['LineCurrents'].ravel()
+            )), fmt=('%d', '%.3f', '%d', '%.15g'), delimiter=',')
+
+            # Voltages of the energized buses only.
+            Vm = state['Vm'][state['Vm'] > 0]
+            summary.writerow([line, state['Energized'], Vm.min(), Vm.max(),
+                              state['LineCurrents'].max(), state['Converged']])
+
+            if i % max(len(outages) // 10, 1) == 0 or i == len(outages):
+                logger.info("{}/{} outages ({:.1f} outages/s, {} not converged)"
+                            .format(i, len(outages), i / (timer() - start_time), no_failures))
+
+    return 0 if no_failures == 0 else 1
+
+
+if __name__ == '__main__':
+    exit(main())
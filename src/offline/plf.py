@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Monte Carlo probabilistic load flow.
+
+Samples the power of every resource independently from its trace (see
+`profiles.py`), solves the samples in batches on a pool of worker processes,
+and aggregates the bus voltages and line currents on the fly into fixed-bin
+histograms, from which their quantiles are computed.
+
+"""
+
+from argparse import ArgumentParser
+from csv import writer
+from logging import basicConfig, getLogger, INFO
+from multiprocessing import get_context, cpu_count
+from os import path, makedirs
+from sys import stdout, exit
+from timeit import default_timer as timer
+
+from numpy import zeros, arange, bincount, absolute, maximum, minimum, \
+    argmax, full, inf
+from numpy.random import default_rng, SeedSequence
+
+import sourcepaths  # Makes the grid model and the utilities importable.
+
+from singlephasegrid import SinglePhaseGrid
+from gridmodule import solver_kwargs
+from snippets import load_json_file
+from profiles import resource_profiles, slack_voltage_profile
+
+basicConfig(stream=stdout, level=INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = getLogger('grid.plf')
+
+
+BATCH_SIZE = 1000  # Number of samples solved at once by a worker.
+BINS = 2000  # Number of bins of the histograms.
+QUANTILES = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+# Study shared with the workers.  It is set before the pool is created and
+# inherited by the forked workers, so that the factorized grid is never
+# pickled.
+study = None
+
+
+def sample_injections(rng, no_samples):
+    """Sample the power of the resources and the slack voltage.
+
+    Each resource is sampled at independent random times, uniformly over its
+    trace or over the study horizon, and its power is optionally scaled by a
+    Gaussian error.
+
+    Parameters
+    ----------
+        rng : numpy.random.Generator
+            Random generator to use.
+
+        no_samples : int
+            Number of samples.
+
+    Returns
+    -------
+        (P, Q, V0) : tuple of numpy.ndarray
+            Power of the PQ buses, shape (no_samples, no_buses - 1), and slack
+            voltage, shape (no_samples, ).
+
+    """
+    grid = study['grid']
+    P = zeros((no_samples, grid.no_buses - 1))
+    Q = zeros((no_samples, grid.no_buses - 1))
+
+    for _, bus_index, profile in study['profiles']:
+        duration = getattr(profile, 'duration', None) or study['horizon']
+        P_r, Q_r = profile(rng.uniform(0, duration, no_samples))
+        if study['noise']:
+            error = 1 + study['noise'] * rng.standard_normal(no_samples)
+            P_r, Q_r = P_r * error, Q_r * error
+        P[:, bus_index - 1] += P_r
+        Q[:, bus_index - 1] += Q_r
+
+    slack_voltage = study['slack_voltage']
+    duration = getattr(slack_voltage, 'duration', None) or study['horizon']
+    V0 = slack_voltage(rng.uniform(0, duration, no_samples))
+
+    return P, Q, V0
+
+
+def solve_samples(rng, no_samples):
+    """Solve a batch of samples.
+
+    Returns
+    -------
+        (Vm, LineCurrents, converged) : tuple
+            Voltage magnitudes (no_samples, no_buses), line currents
+            (no_samples, no_lines), and whether the batch converged.
+
+    """
+    grid = study['grid']
+    V, _, forwardCurrents, backwardCurrents = grid.update_batch(*sample_injections(rng, no_samples))
+    return absolute(V), maximum(absolute(forwardCurrents), absolute(backwardCurrents)), grid.batch_converged
+
+
+def histogram(values, low, high, bins):
+    """One histogram per column of `values`, over the per-column range
+    [low, high), with values out of range counted in the first or last bin.
+
+    """
+    no_columns = values.shape[1]
+    indices = ((values - low) / (high - low) * bins).astype(int).clip(0, bins - 1)
+    indices += arange(no_columns) * bins
+    return bincount(indices.ravel(), minlength=no_columns * bins).reshape(no_columns, bins)
+
+
+def histogram_quantiles(counts, low, high, quantiles):
+    """Quantiles of every row of a histogram with per-row range [low, high),
+    interpolated within the bins.
+
+    """
+    no_rows, bins = counts.shape
+    rows = arange(no_rows)
+    cumulative = counts.cumsum(axis=1)
+    total = cumulative[:, -1]
+
+    result = zeros((no_rows, len(quantiles)))
+    for j, quantile in enumerate(quantiles):
+        target = quantile * total
+        index = argmax(cumulative >= target[:, None], axis=1)
+        below = cumulative[rows, index] - counts[rows, index]
+        fraction = (target - below) / maximum(counts[rows, index], 1)
+        result[:, j] = low + (index + fraction) * (high - low) / bins
+
+    return result
+
+
+class Aggregate:
+    """Streaming aggregate of one quantity (one column per bus or line).
+
+    """
+    def __init__(self, no_columns, low, high, bins):
+        self.low, self.high, self.bins = low, high, bins
+        self.counts = zeros((no_columns, bins), dtype=int)
+        self.total = zeros(no_columns)
+        self.min = full(no_columns, inf)
+        self.max = full(no_columns, -inf)
+        self.clipped = zeros(no_columns, dtype=int)
+        self.no_samples = 0
+
+    def add(self, values):
+        self.counts += histogram(values, self.low, self.high, self.bins)
+        self.clipped += ((values < self.low) | (values >= self.high)).sum(axis=0)
+        self.total += values.sum(axis=0)
+        self.min = minimum(self.min, values.min(axis=0))
+        self.max = maximum(self.max, values.max(axis=0))
+        self.no_samples += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.clipped += other.clipped
+        self.total += other.total
+        self.min = minimum(self.min, other.min)
+        self.max = maximum(self.max, other.max)
+        self.no_samples += other.no_samples
+
+    def check_range(self, name):
+        """Warn about the samples that fell outside the range of the
+        histograms, whose quantiles are then biased towards its bounds.
+
+        """
+        # The exact min and max tell which columns overflowed the range.
+        outside = (self.min < self.low) | (self.max >= self.high)
+        if outside.any():
+            index = argmax(outside)
+            logger.warning("{} samples of the {} fell outside the range of the histograms of {} columns and were "
+                           "counted at its bounds (e.g., #{}: samples in [{:.6g}, {:.6g}], histogram over "
+                           "[{:.6g}, {:.6g})), increase --batch_size for a wider pilot batch"
+                           .format(self.clipped.sum(), name, outside.sum(), index,
+                                   self.min[index], self.max[index], self.low[index], self.high[index]))
+
+    def write(self, csv_path, index_name, quantiles):
+        """Write the mean, min, max and quantiles of every column to a CSV file.
+
+        """
+        mean = self.total / max(self.no_samples, 1)
+        values = histogram_quantiles(self.counts, self.low, self.high, quantiles)
+        with open(csv_path, 'w', newline='') as csv_file:
+            csv_writer = writer(csv_file)
+            csv_writer.writerow([index_name, 'Mean', 'Min', 'Max'] +
+                                ['Q{}'.format(quantile) for quantile in quantiles])
+            for index in range(len(mean)):
+                csv_writer.writerow([index, mean[index], self.min[index], self.max[index]] +
+                                    values[index].tolist())
+
+
+def run_batch(task):
+    """Solve a batch of samples in a worker and aggregate it.
+
+    Parameters
+    ----------
+        task : tuple
+            Seed of the batch and number of samples.
+
+    Returns
+    -------
+        (voltages, currents, converged) : tuple
+            Aggregates of the voltage magnitudes and line currents, and whether
+            the batch converged.
+
+    """
+    seed, no_samples = task
+    Vm, LineCurrents, converged = solve_samples(default_rng(seed), no_samples)
+
+    voltages = Aggregate(Vm.shape[1], *study['voltage_range'], study['bins'])
+    voltages.add(Vm)
+    currents = Aggregate(LineCurrents.shape[1], *study['current_range'], study['bins'])
+    currents.add(LineCurrents)
+
+    return voltages, currents, converged
+
+
+def histogram_range(values):
+    """Per-column range of the histograms, taken around the values of a pilot
+    batch.
+
+    """
+    low, high = values.min(axis=0), values.max(axis=0)
+    margin = maximum(high - low, 1e-3 * absolute(high) + 1e-9)
+    return maximum(low - margin, 0), high + margin
+
+
+def main():
+    # Parse the arguments.
+    parser = ArgumentParser(
+        description="Monte Carlo probabilistic load flow of the grid."
+    )
+    parser.add_argument("grid_config_path",
+                        help="Path to the JSON config file for the grid")
+    parser.add_argument("resource_config_path",
+                        help="Path to the JSON config file for the resources")
+    parser.add_argument("output_path",
+                        help="Path to the directory to which to write the results")
+    parser.add_argument("--samples",
+                        help="Number of samples",
+                        type=int, default=100000)
+    parser.add_argument("--batch_size",
+                        help="Number of samples solved at once by a worker",
+                        type=int, default=BATCH_SIZE)
+    parser.add_argument("--processes",
+                        help="Number of worker processes",
+                        type=int, default=cpu_count())
+    parser.add_argument("--seed",
+                        help="Seed of the random generator",
+                        type=int, default=None)
+    parser.add_argument("--horizon",
+                        help="Time span (in seconds) over which resources without a finite trace are sampled",
+                        type=float, default=86400)
+    parser.add_argument("--noise",
+                        help="Relative standard deviation of the Gaussian error on the power of every resource",
+                        type=float, default=0)
+    parser.add_argument("--bins",
+                        help="Number of bins of the histograms",
+                        type=int, default=BINS)
+    parser.add_argument("--quantiles",
+                        help="Quantiles to compute",
+                        type=float, nargs='+', default=QUANTILES)
+    args = parser.parse_args()
+
+    # Load the configuration files.
+    config = load_json_file(args.grid_config_path, logger)
+    resource_config = load_json_file(args.resource_config_path, logger)
+
+    if config['grid'].get('model', 'singlephase') != 'singlephase':
+        logger.error("Only the single-phase grid model is supported, not {}".format(config['grid']['model']))
+        return 1
+
+    global study
+    study = {
+        'grid': SinglePhaseGrid(config['grid'], **solver_kwargs(config['grid'])),
+        'profiles': resource_profiles(
+            config, resource_config,
+            path.dirname(path.abspath(args.resource_config_path)), logger),
+        'slack_voltage': slack_voltage_profile(config['grid']['slack_voltage']),
+        'horizon': args.horizon,
+        'noise': args.noise,
+        'bins': args.bins
+    }
+
+    # Set the range of the histograms from a pilot batch.
+    seeds = SeedSequence(args.seed)
+    Vm, LineCurrents, _ = solve_samples(default_rng(seeds.spawn(1)[0]), args.batch_size)
+    study['voltage_range'] = histogram_range(Vm)
+    study['current_range'] = histogram_range(LineCurrents)
+
+    grid = study['grid']
+    voltages = Aggregate(grid.no_buses, *study['voltage_range'], args.bins)
+    currents = Aggregate(grid.no_lines, *study['current_range'], args.bins)
+
+    no_batches = -(-args.samples // args.batch_size)
+    tasks = [(seed, min(args.batch_size, args.samples - i * args.batch_size))
+             for i, seed in enumerate(seeds.spawn(no_batches))]
+
+    logger.info("Solve {} samples in {} batches on {} processes"
+                .format(args.samples, no_batches, args.processes))
+    start_time = timer()
+    no_failures = 0
+
+    with get_context('fork').Pool(args.processes) as pool:
+        for i, (batch_voltages, batch_currents, converged) in enumerate(
+                pool.imap_unordered(run_batch, tasks), 1):
+            voltages.merge(batch_voltages)
+            currents.merge(batch_currents)
+            if not converged:
+                no_failures += 1
+            if i % max(no_batches // 10, 1) == 0 or i == no_batches:
+                logger.info("{}/{} batches ({:.0f} samples/s, {} not converged)"
+                            .format(i, no_batches, voltages.no_samples / (timer() - start_time), no_failures))
+
+    voltages.check_range('bus voltages')
+    currents.check_range('line currents')
+
+    makedirs(args.output_path, exist_ok=True)
+    voltages.write(path.join(args.output_path, 'plf_bus.csv'), 'BusIndex', args.quantiles)
+    currents.write(path.join(args.output_path, 'plf_line.csv'), 'Line #', args.quantiles)
+
+    return 0 if no_failures == 0 else 1
+
+
+if __name__ == '__main__':
+    exit(main())
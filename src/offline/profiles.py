@@ -0,0 +1,277 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Power profiles of the resource models for offline studies.
+
+The profiles reproduce, without any agent or network, the power that the
+resource models of `src/model/resource` implement on the grid.  They follow
+the sign convention of T-RECS: generation is positive and demand negative.
+A profile replaying a finite trace has a `duration` attribute, i.e., the
+time (in seconds) the trace covers before being replayed or held.
+
+"""
+
+from csv import reader, QUOTE_NONNUMERIC
+from math import sqrt
+from os import path
+from numpy import array, asarray, searchsorted, zeros, full, sort, minimum, \
+    mod, loadtxt
+
+
+# Defaults of the EV charging station model (see evcs.py).
+EV_CHARGING_MAX_P = 21120  # W
+EV_CHARGING_STAY_TIME = 14400  # s
+EV_ENERGY_DEMAND = 90  # kWh
+EV_ARRIVALS_PATH = path.join(path.dirname(path.abspath(__file__)), path.pardir,
+                             'model', 'resource', 'evcs',
+                             'arrivals_in_secs_with_400_max_charging_slots.csv')
+
+
+def load_trace(trace_path):
+    """Load a trace whose first column is a timestamp in seconds.
+
+    Parameters
+    ----------
+        trace_path : path_like
+            Path to the CSV trace.
+
+    Returns
+    -------
+        trace : numpy.ndarray
+            Trace with the timestamps shifted to start at 0.
+
+    Raises
+    ------
+        error : IOError
+            Could not open the trace
+
+        error : ValueError
+            Wrong or missing value in the trace
+
+    """
+    with open(trace_path, 'r') as f:
+        trace = array(list(reader(f, quoting=QUOTE_NONNUMERIC)), dtype=float)
+
+    trace[:, 0] -= trace[0, 0]
+    return trace
+
+
+def sample_and_hold(timestamps, values, times):
+    """Value of a trace at given times, holding each sample until the next.
+
+    Times before the first sample take the first value and times after the
+    last sample take the last value.
+
+    """
+    indices = searchsorted(timestamps, times, side='right') - 1
+    return values[minimum(indices.clip(0), len(values) - 1)]
+
+
+def ucpv_profile(params):
+    """Power of an uncontrollable PV (see ucpv.py).
+
+    The irradiance trace is replayed from the start once its end is reached.
+
+    """
+    irradiance = load_trace(params['irradiance_trace_file_path'])
+    timestamps, values = irradiance[:, 0], irradiance[:, 1]
+    values = values * params['rated_power_dc_side'] / params['S_STC'] * \
+        params['converter_efficiency']
+    period = timestamps[-1] + (timestamps[-1] - timestamps[-2])
+
+    def profile(times):
+        P = sample_and_hold(timestamps, values, mod(times, period))
+        return P, zeros(len(P))
+
+    profile.duration = period
+    return profile
+
+
+def ucload_profile(params):
+    """Power of an uncontrollable load (see ucload.py).
+
+    The trace contains one apparent power (in kVA) per `sample_period`, and is
+    replayed from the start once its end is reached.
+
+    """
+    S = loadtxt(params['trace_file_path'], ndmin=1) * 1e3
+    sample_period = params['sample_period'] / 1e3
+    power_factor = params['power_factor']
+
+    def profile(times):
+        S_t = S[(asarray(times) // sample_period).astype(int) % len(S)]
+        return -S_t * power_factor, -S_t * sqrt(1 - power_factor * power_factor)
+
+    profile.duration = len(S) * sample_period
+    return profile
+
+
+def evcs_profile(params):
+    """Power of an EV charging station (see evcs.py).
+
+    Without a charging station agent, every EV charges at full power from its
+    arrival until its energy demand is met or it leaves.
+
+    """
+    arrivals = sort(load_trace(
+        params.get('arrivals_trace_file_path', EV_ARRIVALS_PATH))[:, 1])
+    charging_power = params.get('charging_power', EV_CHARGING_MAX_P)
+    charging_time = min(params.get('stay_time', EV_CHARGING_STAY_TIME),
+                        params.get('energy_demand', EV_ENERGY_DEMAND) * 3.6e6 / charging_power)
+    departures = arrivals + charging_time
+
+    def profile(times):
+        charging = searchsorted(arrivals, times, side='right') - \
+            searchsorted(departures, times, side='right')
+        return -charging * charging_power, zeros(len(charging))
+
+    return profile
+
+
+def battery_profile(params):
+    """Power of a battery without its agent, i.e., its initial setpoint.
+
+    """
+    P, Q = params.get('initialP', 0), params.get('initialQ', 0)
+
+    def profile(times):
+        return full(len(times), P, dtype=float), full(len(times), Q, dtype=float)
+
+    return profile
+
+
+PROFILES = {
+    'ucpv': ucpv_profile,
+    'ucload': ucload_profile,
+    'evcs': evcs_profile,
+    'battery': battery_profile
+}
+
+
+def resource_profiles(grid_config, resource_config, resource_config_dir=None, logger=None):
+    """Build the profiles of the resources attached to the grid.
+
+    Parameters
+    ----------
+        grid_config : dict
+            Grid configuration, with the `resources` attached to the buses.
+
+        resource_config : dict
+            Resource configuration, with the parameters of every resource.
+
+        resource_config_dir : path_like (optional, default None)
+            Directory against which the relative `_path` entries of the
+            resource configuration are resolved, as in `runtestbed.py`.
+
+        logger : logging.Logger (optional, default None)
+            Logger to use.
+
+    Returns
+    -------
+        profiles : list of tuple
+            One (resource_name, bus_index, profile) entry per resource, where
+            `profile(times)` returns the P and Q (in W and Var) of the
+            resource at the given times (in seconds).
+
+    """
+    params = {resource['resource_name']: resource
+              for resource in resource_config['resources']}
+
+    profiles = []
+    for resource in grid_config['resources']:
+        name, type_ = resource['resource_name'], resource['resource_type']
+        if type_ not in PROFILES:
+            if logger is not None:
+                logger.warning("No offline profile for {} ({}), it is left at 0"
+                               .format(name, type_))
+            continue
+
+        resource_params = dict(params.get(name, {}))
+        if resource_config_dir is not None:
+            for key, value in resource_params.items():
+                if key.endswith('_path') and value:
+                    resource_params[key] = path.join(resource_config_dir, value)
+
+        profiles.append((name, resource['bus_index'], PROFILES[type_](resource_params)))
+
+    return profiles
+
+
+def bus_injections(profiles, no_buses, times):
+    """Power injected at the PQ buses at given times.
+
+    Parameters
+    ----------
+        profiles : list of tuple
+            Profiles as returned by `resource_profiles`.
+
+        no_buses : int
+            Number of buses of the grid, including the slack bus.
+
+        times : array_like
+            Times (in seconds).
+
+    Returns
+    -------
+        (P, Q) : tuple of numpy.ndarray, shape (len(times), no_buses - 1)
+            Active and reactive power of the PQ buses at every time.
+
+    """
+    times = asarray(times, dtype=float)
+    P = zeros((len(times), no_buses - 1))
+    Q = zeros((len(times), no_buses - 1))
+    for _, bus_index, profile in profiles:
+        P_r, Q_r = profile(times)
+        P[:, bus_index - 1] += P_r
+        Q[:, bus_index - 1] += Q_r
+
+    return P, Q
+
+
+def slack_voltage_profile(slack_config):
+    """Slack bus voltage as used by the grid module.
+
+    Parameters
+    ----------
+        slack_config : dict
+            The `slack_voltage` section of the grid configuration.
+
+    Returns
+    -------
+        profile : callable
+            `profile(times)` returns the complex slack voltage at the given
+            times (in seconds).  The last sample of a trace is held once its
+            end is reached.
+
+    """
+    if slack_config['use_trace']:
+        trace = load_trace(slack_config['trace_file_path'])
+        timestamps, values = trace[:, 0], trace[:, 1] + 1j * trace[:, 2]
+        def profile(times):
+            return sample_and_hold(timestamps, values, asarray(times))
+
+        profile.duration = timestamps[-1]
+        return profile
+
+    voltage = complex(slack_config['voltage_real'], slack_config['voltage_imaginary'])
+    return lambda times: full(len(times), voltage)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Offline quasi-static time-series (QSTS) simulation of the grid.
+
+Replays the resource traces of a T-RECS scenario through the grid model as
+fast as possible, without Mininet, sockets or real-time sleeps.  Each load
+flow is warm-started from the previous step, and the states are written in
+chunks to `grid_bus.csv` and `grid_line.csv`, in the same format as the logs
+of the grid module.  The violations of the line and voltage limits are
+written to `grid_violations.csv` as they happen.
+
+"""
+
+from argparse import ArgumentParser
+from csv import DictWriter
+from logging import basicConfig, getLogger, INFO
+from os import path, makedirs
+from sys import stdout, exit
+from timeit import default_timer as timer
+
+from datetime import datetime, timedelta
+
+from numpy import arange, empty, repeat, tile, savetxt, datetime64, datetime_as_string
+
+import sourcepaths  # Makes the grid model and the utilities importable.
+
+from singlephasegrid import SinglePhaseGrid
+from gridmodule import solver_kwargs, extract_state, ViolationMonitor, VIOLATION_FIELDS
+from snippets import load_json_file
+from profiles import resource_profiles, bus_injections, slack_voltage_profile
+
+basicConfig(stream=stdout, level=INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = getLogger('grid.qsts')
+
+
+CHUNK_SIZE = 1000  # Number of time steps written at once.
+
+
+def write_chunk(log_file_bus, log_file_line, times, chunk):
+    """Append a chunk of states to the bus and line logs.
+
+    Parameters
+    ----------
+        log_file_bus : file
+            Bus log, with the columns of `grid_bus.csv`.
+
+        log_file_line : file
+            Line log, with the columns of `grid_line.csv`.
+
+        times : numpy.ndarray
+            Timestamp (`datetime64`) of every state of the chunk.
+
+        chunk : dict
+            States of the chunk, one row per time step for 'P', 'Q', 'Vm',
+            'Va' and 'LineCurrents'.
+
+    """
+    no_steps, no_buses = chunk['Vm'].shape
+    no_lines = chunk['LineCurrents'].shape[1]
+    # Timestamps as written by the grid module, i.e., `str(datetime)`.
+    timestamps = [timestamp.replace('T', ' ') for timestamp in datetime_as_string(times, unit='us')]
+
+    rows = empty((no_steps * no_buses, 6), dtype=object)
+    rows[:, 0] = repeat(timestamps, no_buses)
+    rows[:, 1] = tile(arange(no_buses), no_steps)
+    for column, key in enumerate(('P', 'Q', 'Vm', 'Va'), 2):
+        rows[:, column] = chunk[key].ravel()
+    savetxt(log_file_bus, rows, fmt=('%s', '%d', '%.15g', '%.15g', '%.15g', '%.15g'), delimiter=',')
+
+    rows = empty((no_steps * no_lines, 3), dtype=object)
+    rows[:, 0] = repeat(timestamps, no_lines)
+    rows[:, 1] = tile(arange(no_lines), no_steps)
+    rows[:, 2] = chunk['LineCurrents'].ravel()
+    savetxt(log_file_line, rows, fmt=('%s', '%d', '%.15g'), delimiter=',')
+
+
+def run(grid, profiles, slack_voltage, times, log_path, chunk_size=CHUNK_SIZE,
+        monitor=None, stop_on_violation=False, start=None):
+    """Run the load flows of a time series and log the states.
+
+    Parameters
+    ----------
+        grid : SinglePhaseGrid
+            Grid to simulate.
+
+        profiles : list of tuple
+            Resource profiles, as returned by `profiles.resource_profiles`.
+
+        slack_voltage : callable
+            Slack voltage profile, as returned by
+            `profiles.slack_voltage_profile`.
+
+        times : numpy.ndarray
+            Time (in seconds) of every step.
+
+        log_path : path_like
+            Directory to which to write the bus and line logs.
+
+        chunk_size : int (optional, default CHUNK_SIZE)
+            Number of time steps kept in memory before writing them.
+
+        monitor : ViolationMonitor (optional, default None)
+            Monitor with which to check the limits of the grid at every
+            step.  The violations are written to `grid_violations.csv`.
+
+        stop_on_violation : bool (optional, default False)
+            Whether to stop the simulation at the first violation.
+
+        start : datetime (optional, default None)
+            Timestamp of the time 0 in the logs.  If None, the time at which
+            the simulation starts.
+
+    Returns
+    -------
+        no_failures : int
+            Number of load flows that did not converge.
+
+    """
+    chunk = {
+        'P': empty((chunk_size, grid.no_buses)),
+        'Q': empty((chunk_size, grid.no_buses)),
+        'Vm': empty((chunk_size, grid.no_buses)),
+        'Va': empty((chunk_size, grid.no_buses)),
+        'LineCurrents': empty((chunk_size, grid.no_lines))
+    }
+    no_failures = 0
+    stopped = False
+    start_time = timer()
+    if start is None:
+        start = datetime.now()
+
+    with open(path.join(log_path, 'grid_bus.csv'), 'w', newline='') as log_file_bus, \
+            open(path.join(log_path, 'grid_line.csv'), 'w', newline='') as log_file_line, \
+            open(path.join(log_path, 'grid_violations.csv'), 'w', buffering=1, newline='') as log_file_violations:
+        log_file_bus.write('Timestamp,BusIndex,P,Q,Vm,Va\n')
+        log_file_line.write('Timestamp,Line #,LineCurrent\n')
+        log_writer_violations = DictWriter(log_file_violations, VIOLATION_FIELDS)
+        log_writer_violations.writeheader()
+
+        for first in range(0, len(times), chunk_size):
+            chunk_times = times[first:first + chunk_size]
+            P, Q = bus_injections(profiles, grid.no_buses, chunk_times)
+            V0 = slack_voltage(chunk_times)
+
+            for step in range(len(chunk_times)):
+                grid.update(P[step], Q[step], V0[step].real, V0[step].imag)
+                if not grid.converged:
+                    no_failures += 1
+
+                state = extract_state(grid)
+                for key, values in chunk.items():
+                    values[step] = state[key]
+
+                if monitor is not None:
+                    events = monitor.check(state, start + timedelta(seconds=float(chunk_times[step])))
+                    log_writer_violations.writerows(events)
+                    started = [event for event in events if event['Event'] == 'start']
+                    if stop_on_violation and started:
+                        logger.warning("Stop at {:.3f} s on {} violations, the first one: {}"
+                                       .format(chunk_times[step], len(started), started[0]))
+                        chunk_times = chunk_times[:step + 1]
+                        stopped = True
+                        break
+
+            write_chunk(log_file_bus, log_file_line,
+                        datetime64(start, 'us') + (chunk_times * 1e6).round().astype('timedelta64[us]'),
+                        {key: values[:len(chunk_times)] for key, values in chunk.items()})
+
+            elapsed_time = timer() - start_time
+            done = first + len(chunk_times)
+            logger.info("{}/{} steps ({:.1f} steps/s, {} not converged, ongoing violations: {})"
+                        .format(done, len(times), done / elapsed_time, no_failures,
+                                monitor.active if monitor is not None else None))
+            if stopped:
+                break
+
+    return no_failures
+
+
+def main():
+    # Parse the arguments.
+    parser = ArgumentParser(
+        description="Offline quasi-static time-series simulation of the grid."
+    )
+    parser.add_argument("grid_config_path",
+                        help="Path to the JSON config file for the grid")
+    parser.add_argument("resource_config_path",
+                        help="Path to the JSON config file for the resources")
+    parser.add_argument("log_path",
+                        help="Path to the directory to which to write the logs")
+    parser.add_argument("--step",
+                        help="Time step (in milli seconds)",
+                        type=float, default=50)
+    parser.add_argument("--duration",
+                        help="Simulated time (in seconds)",
+                        type=float, default=86400)
+    parser.add_argument("--chunk_size",
+                        help="Number of time steps written to disk at once",
+                        type=int, default=CHUNK_SIZE)
+    parser.add_argument("--start",
+                        help="Timestamp of the beginning of the simulation in the logs "
+                             "(ISO format, default now)",
+                        type=datetime.fromisoformat, default=None)
+    parser.add_argument("--stop_on_violation",
+                        help="Stop at the first violation of a line or voltage limit",
+                        action='store_true')
+    args = parser.parse_args()
+
+    # Load the configuration files.
+    config = load_json_file(args.grid_config_path, logger)
+    resource_config = load_json_file(args.resource_config_path, logger)
+
+    if config['grid'].get('model', 'singlephase') != 'singlephase':
+        logger.error("Only the single-phase grid model is supported, not {}".format(config['grid']['model']))
+        return 1
+
+    profiles = resource_profiles(
+        config, resource_config,
+        path.dirname(path.abspath(args.resource_config_path)), logger)
+    slack_voltage = slack_voltage_profile(config['grid']['slack_voltage'])
+
+    grid = SinglePhaseGrid(config['grid'], **solver_kwargs(config['grid']))
+    monitor = ViolationMonitor(config['grid'], grid.no_buses, grid.no_lines)
+
+    makedirs(args.log_path, exist_ok=True)
+    times = arange(0, args.duration, args.step / 1e3)
+    logger.info("Simulate {} steps of {} ms on {} buses"
+                .format(len(times), args.step, grid.no_buses))
+
+    no_failures = run(grid, profiles, slack_voltage, times, args.log_path,
+                      args.chunk_size, monitor, args.stop_on_violation, args.start)
+
+    return 0 if no_failures == 0 else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,41 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2018 École Polytechnique Fédérale de Lausanne (EPFL)
+# Author: Jagdish P. Achara
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Source paths of the offline scripts.
+
+Importing this module puts the directories of the grid models, the grid
+module, the API and the utilities first on `sys.path`, so that the offline
+scripts import them from the source tree.
+
+"""
+
+from os import path
+import sys
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), path.pardir)
+
+sys.path[:0] = [path.join(SRC_DIR, 'model', 'grid', 'singlephase'),
+                path.join(SRC_DIR, 'model', 'grid', 'threephase'),
+                path.join(SRC_DIR, 'module'),
+                path.join(SRC_DIR, 'api'),
+                path.join(SRC_DIR, 'util')]
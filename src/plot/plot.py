@@ -92,6 +92,20 @@ def GA_parse(log_file):
     return pd.DataFrame.from_dict(data)
 
 
+def groups(df, column, name):
+    """Groups of a grid log file by bus or line, and by phase if the log file
+    has a `PhaseIndex` column (three-phase grid), with their labels.
+
+    """
+    if 'PhaseIndex' not in df:
+        for index, group in df.groupby(column):
+            yield group, '{} #{:d}'.format(name, index)
+        return
+
+    for (index, phase), group in df.groupby([column, 'PhaseIndex']):
+        yield group, '{} #{:d} (phase {:d})'.format(name, index, phase)
+
+
 # From https://pymotw.com/2/argparse/ or
 # https://stackoverflow.com/questions/8632354/python-argparse-custom-actions-with-additional-arguments-passed
 class AbsPathAction(argparse.Action):
@@ -153,26 +167,26 @@ def main():
         df = df[df.BusIndex != 0]
 
         plt.figure()
-        for index, group in df.groupby('BusIndex'):
-            plt.plot(group['P'], label='bus #{:d}'.format(index))
+        for group, label in groups(df, 'BusIndex', 'bus'):
+            plt.plot(group['P'], label=label)
         plt.title("Real power (P, in W)")
         plt.legend(loc='best')
 
         plt.figure()
-        for index, group in df.groupby('BusIndex'):
-            plt.plot(group['Q'], label='bus #{:d}'.format(index))
+        for group, label in groups(df, 'BusIndex', 'bus'):
+            plt.plot(group['Q'], label=label)
         plt.title("Reactive power (Q, in Var)")
         plt.legend(loc='best')
 
         plt.figure()
-        for index, group in df.groupby('BusIndex'):
-            plt.plot(group['Vm'], label='bus #{:d}'.format(index))
+        for group, label in groups(df, 'BusIndex', 'bus'):
+            plt.plot(group['Vm'], label=label)
         plt.title("Voltage magnitude (Vm)")
         plt.legend(loc='best')
 
         plt.figure()
-        for index, group in df.groupby('BusIndex'):
-            plt.plot(group['Va'], label='bus #{:d}'.format(index))
+        for group, label in groups(df, 'BusIndex', 'bus'):
+            plt.plot(group['Va'], label=label)
         plt.title("Voltage angle (Va, in degrees)")
         plt.legend(loc='best')
     except Exception as e:
@@ -184,8 +198,8 @@ def main():
         df = df[df['Line #'] != 0]
 
         plt.figure(5)
-        for index, group in df.groupby('Line #'):
-            plt.plot(group['LineCurrent'], label='Line #{:d}'.format(index))
+        for group, label in groups(df, 'Line #', 'Line'):
+            plt.plot(group['LineCurrent'], label=label)
         plt.title("Line current (I)")
         plt.legend(loc='best')
     except Exception as e:
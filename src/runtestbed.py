@@ -599,8 +599,8 @@ def load_grid_config(config_path):
     -------
         (type_map, bus_map, resource_types) : tuple
             Triple consisting of a dictionary mapping resource names to types,
-            a dictionary mapping resource names to bus indices, and
-            a set of resources.
+            a dictionary mapping resource names to their bus index (and phase
+            in a three-phase grid), and a set of resources.
 
     """
     config = load_json_file(config_path)
@@ -613,7 +613,7 @@ def load_grid_config(config_path):
     }
 
     bus_map = {
-        resource['resource_name']: resource['bus_index']
+        resource['resource_name']: {key: resource[key] for key in ('bus_index', 'phase') if key in resource}
         for resource in config['resources']
     }
 
@@ -652,7 +652,8 @@ def create_resource_config_files(host_config, resource_config, type_map, bus_map
             A dictionary mapping resource names to types.
 
         bus_map : dictionary
-            A dictionary mapping resource names to buses.
+            A dictionary mapping resource names to their bus index (and
+            phase in a three-phase grid).
 
         trecs_root_dir : path_like
             Path of T-RECS root directory.
@@ -681,10 +682,10 @@ def create_resource_config_files(host_config, resource_config, type_map, bus_map
                 'ip': '127.0.0.1',
                 'listen_port': agent_listen_port
             },
-            'bus_index': bus_map[resource_name],
             'listen_port': model_listen_port,
             'log_path': path.join(output_dir, 'csv', '{}.csv'.format(resource_name))
         }
+        init_data.update(bus_map[resource_name])
 
         resource = next(resource for resource in resource_config['resources'] if resource['resource_name'] == resource_name)
         for key in resource.keys():
@@ -66,7 +66,8 @@ def dump_json_data(contents, encoding='utf-8'):
     Parameters
     ----------
         contents : dict
-            Contents to dump.
+            Contents to dump.  NumPy arrays and scalars are dumped as lists
+            and numbers.
 
         encoding : str (optional, default 'utf-8')
             Encoding to use.
@@ -77,7 +78,15 @@ def dump_json_data(contents, encoding='utf-8'):
             JSON contents encoded to binary.
 
     """
-    return json.dumps(contents).encode(encoding)
+    return json.dumps(contents, default=_to_builtin).encode(encoding)
+
+
+def _to_builtin(value):
+    # Convert NumPy arrays and scalars to lists and numbers for JSON.
+    try:
+        return value.tolist()
+    except AttributeError:
+        raise TypeError("{} is not JSON serializable".format(type(value).__name__))
 
 
 def load_api(api_path, check_readiness=True):